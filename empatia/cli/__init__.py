@@ -10,6 +10,8 @@ from empatia.cli.pipelines import (
     monthly_pipeline,
 )
 from empatia.cli.training import train
+from empatia.settings.constants import RASTER_ENGINE
+from empatia.utils.engine import ENGINES
 
 
 @click.group(
@@ -32,8 +34,29 @@ def run_viirs_etl() -> None:
 @main.command(name="compute_daily_products")
 @click.option("--start-date", "start_date", type=str)
 @click.option("--end-date", "end_date", type=str)
-def compute_daily_products(start_date: str, end_date: str) -> None:
-    daily_pipeline(start_date, end_date)
+@click.option(
+    "--workers",
+    default=1,
+    type=int,
+    help="Number of processes to compute dates in parallel",
+)
+@click.option(
+    "--prefetch",
+    default=0,
+    type=int,
+    help="Number of dates whose inputs are downloaded while processing",
+)
+@click.option(
+    "--engine",
+    "raster_engine",
+    default=RASTER_ENGINE,
+    type=click.Choice(list(ENGINES)),
+    help="Engine for raster operations",
+)
+def compute_daily_products(
+    start_date: str, end_date: str, workers: int, prefetch: int, raster_engine: str
+) -> None:
+    daily_pipeline(start_date, end_date, workers, prefetch, raster_engine)
 
 
 @main.command(name="compute_monthly_products")
@@ -1,18 +1,42 @@
 import datetime as dt
 import glob
-import itertools
 import json
-import math
 import os
+import itertools
+import multiprocessing
 
-from collections import defaultdict
+from collections import Counter, defaultdict
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+import numpy as np
 from pyspatialml import Raster
-from typing import Any, DefaultDict, Dict, List, Tuple
+from typing import (
+    Any,
+    DefaultDict,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
 
 
-from empatia.etl.merra_data_source import get_merra_files
+from empatia.etl.download_cache import (
+    add_cache_counts,
+    pop_cache_counts,
+    pop_cache_report,
+)
+from empatia.etl.merra_cube import MerraCube, get_merra_band
+from empatia.etl.merra_data_source import get_all_merra_files, get_merra_files
 from empatia.etl.modis_data_source import get_modis_files
-from empatia.etl.transformers import get_modis_mosaic, get_viirs_mosaic
+from empatia.etl.tile_index import (
+    add_skip_counts,
+    get_tile_index,
+    pop_skip_counts,
+    pop_skip_report,
+)
+from empatia.etl.prefetcher import prefetch
+from empatia.etl.transformers import get_modis_mosaics, get_viirs_mosaic
 from empatia.model.estimator import PM10Estimator
 from empatia.settings import (
     DAILY_PM10_TEMPLATE_PATH,
@@ -22,28 +46,39 @@ from empatia.settings import (
     MERRA_DATASET_PATH,
     MODEL_PATH,
     MODIS_DATASET_PATH,
+    MONTHLY_ACCUMULATORS_PATH,
     MONTHLY_PRODUCT_TEMPLATES,
     PM10_COLOR_RULES_PATH,
     PREDICTION_DATA_PATH,
     PROCESSED_DATA_PATH,
     REGION_DATA_PATH,
+    REGRID_CACHE_PATH,
+    TILE_INDEX_CACHE_PATH,
 )
 from empatia.settings.constants import (
     DAILY_PM10_METADATA_CODES,
+    DATE_KEY,
     DEFAULT_DATE_FORMAT,
+    EXPORT_STAGE,
+    ICA_BREAKPOINTS,
     ICA_PATH,
     ICA_PM10_METADATA_CODES,
+    ICA_STAGE,
     MAIAC_BANDS,
     MAIAC_COLLECTION,
     MAIAC_PRODUCT,
+    MANIFEST_FILENAME,
     MERRA_DATASETS,
-    MERRA_SHORTNAME,
+    MERRA_STAGE,
     MIN_PERCENTAGE_OF_VALID_DATA,
     MODIS_REGION,
+    MODIS_STAGE,
     MONTHLY_PM10_METADATA_CODES,
     MONTHLY_PRODUCT_CODES,
     NODATA,
     PM10_PREFIX_FILENAME,
+    PREDICTION_STAGE,
+    RASTER_ENGINE,
     SENSORS,
     VIIRS_COLLECTION,
     VIIRS_DATE_END,
@@ -56,44 +91,41 @@ from empatia.settings.log import logger
 from empatia.utils import (
     create_xml,
     date_range,
-    get_qa_class,
+    enough_valid_data_has_been_collected,
     remove_file,
     remove_folders_from_date,
     zip_directory,
 )
-from empatia.utils.grass import (
-    apply_mask,
-    clean_db,
-    compute_mean,
-    compute_stddev,
-    discretize_values,
-    enough_valid_data_has_been_collected,
-    export_multiband_gtiff,
-    get_count,
-    get_number_of_null_values,
-    get_ranges,
-    get_resampling,
-    import_gtiff,
-    import_netcdf,
-    raster2gtiff,
-    raster2png,
-    refresh_region,
-    remove_mask,
-    reset_color_table,
-    set_domain,
+from empatia.utils import engine
+from empatia.utils.classification import BreakpointTable, read_color_rules_values
+from empatia.utils.domain import (
+    RegionGrid,
+    get_domain_profile,
+    read_on_domain_grid,
+    write_domain_gtiff,
 )
+from empatia.utils.accumulators import (
+    get_monthly_accumulator_path,
+    open_accumulator,
+    read_prediction,
+)
+from empatia.utils.manifest import StageManifest, fingerprint
+from empatia.utils.regrid import BilinearRegridder
+from empatia.utils.stats import get_stats_ranges, read_stats
 
 
 def viirs_etl() -> None:
     """
     Compute the mean of April, May and June of the product `VNP46A1`.
+    Each daily mosaic is added to a running sum and count saved after every
+    day, so an interrupted run resumes from the last accumulated day.
     """
 
     today = dt.datetime.today()
     date_start = dt.datetime.strptime(VIIRS_DATE_START, DEFAULT_DATE_FORMAT)
     date_end = dt.datetime.strptime(VIIRS_DATE_END, DEFAULT_DATE_FORMAT)
     output_dir = f"{PROCESSED_DATA_PATH}/{VIIRS_PRODUCT}_{date_start.year}/"
-    ds_to_download = date_range(date_start, date_end)
+    raster_name = f"viirs_night_lights_{date_start.year}"
     uncompleted_dates = []
     log_file = f"{output_dir}log.txt"
 
@@ -106,9 +138,7 @@ def viirs_etl() -> None:
 
     if os.path.exists(log_file):
         with open(log_file) as json_file:
-            log_data = json.load(json_file)
-            status = log_data["status"]
-            ds_to_download = log_data["uncompleted_dates"]
+            status = json.load(json_file)["status"]
         if status == "OK":
             logger.info("VIIRS data already updated")
             return None
@@ -116,41 +146,50 @@ def viirs_etl() -> None:
     logger.info("Running VIIRS ETL")
 
     logger.info("Setting domain...")
-    set_domain(DOMAIN_DATA_PATH)
-    apply_mask(REGION_DATA_PATH)
+    engine.set_domain(DOMAIN_DATA_PATH)
+    engine.apply_mask(REGION_DATA_PATH)
+    region = RegionGrid(get_domain_profile(DOMAIN_DATA_PATH), engine.get_region_mask())
 
     logger.info("Downloading VIIRS data...")
-    viirs_rasters = []
-    for ds in ds_to_download:
-        try:
-            logger.info(f"Date: {ds}")
-            if not get_modis_files(
-                VIIRS_PRODUCT,
-                VIIRS_COLLECTION,
-                start_date=ds,
-                **MODIS_REGION,  # type: ignore
-            ):
+    with open_accumulator(
+        f"{output_dir}{raster_name}.npz", region.mask.shape, squares=False
+    ) as acc:
+        for ds in date_range(date_start, date_end):
+            outname = f"viirs_{ds}"
+            if outname in acc.products:
+                logger.info(f"VIIRS for {ds} already accumulated")
                 continue
 
-            outname = f"viirs_{ds}"
-            current_viirs_path = f"{MODIS_DATASET_PATH}/{VIIRS_PRODUCT}/{ds}/"
-            get_viirs_mosaic(current_viirs_path, 4, output_dir, f"{outname}.tif")
-            import_gtiff(f"{output_dir}{outname}.tif", outname)
-            viirs_rasters.append(outname)
+            try:
+                logger.info(f"Date: {ds}")
+                if not get_modis_files(
+                    VIIRS_PRODUCT,
+                    VIIRS_COLLECTION,
+                    start_date=ds,
+                    **MODIS_REGION,  # type: ignore
+                ):
+                    continue
+
+                current_viirs_path = f"{MODIS_DATASET_PATH}/{VIIRS_PRODUCT}/{ds}/"
+                get_viirs_mosaic(current_viirs_path, 4, output_dir, f"{outname}.tif")
+                viirs_file = f"{output_dir}{outname}.tif"
+                acc.update(viirs_file, read_on_domain_grid(viirs_file, region), None)
+                acc.save()
+            except Exception as e:
+                logger.error(f"Not found VIIRS for {ds}: {e}")
+                uncompleted_dates.append(ds)
+
+        logger.info("Computing VIIRS average...")
+        try:
+            if not acc.products:
+                raise Exception("no daily mosaic was accumulated")
+            write_domain_gtiff(
+                acc.mean(), f"{output_dir}{raster_name}.tif", region.profile
+            )
+            log_data = {"status": "OK", "uncompleted_dates": uncompleted_dates}
         except Exception as e:
-            logger.error(f"Not found VIIRS for {ds}: {e}")
-            uncompleted_dates.append(ds)
-
-    logger.info("Computing VIIRS average...")
-    try:
-        raster_name = f"viirs_night_lights_{date_start.year}"
-        compute_mean(viirs_rasters, raster_name)
-        refresh_region()
-        raster2gtiff(raster_name, f"{output_dir}{raster_name}")
-        log_data = {"status": "OK", "uncompleted_dates": uncompleted_dates}
-    except Exception as e:
-        logger.error(f"Uncompleted VIIRS update: {e}")
-        log_data = {"status": "FAIL", "uncompleted_dates": uncompleted_dates}
+            logger.error(f"Uncompleted VIIRS update: {e}")
+            log_data = {"status": "FAIL", "uncompleted_dates": uncompleted_dates}
 
     with open(log_file, "w") as outfile:
         json.dump(log_data, outfile)
@@ -175,7 +214,7 @@ def clean_storages(ndays: int) -> None:
     """
 
     logger.info("Cleaning GRASS data base...")
-    clean_db()
+    engine.clean_db()
     logger.info("Cleaning directories...")
     today = dt.datetime.today()
     start_date = today - dt.timedelta(days=ndays)
@@ -209,12 +248,25 @@ def predict(model: Any, rfiles: List, outname: str) -> None:
     _ = prediction.write(file_path=f"{outname}.tif", nodata=NODATA)
 
 
-def daily_pipeline(start_date: str = None, end_date: str = None) -> None:
+def daily_pipeline(
+    start_date: str = None,
+    end_date: str = None,
+    workers: int = 1,
+    prefetch: int = 0,
+    raster_engine: str = RASTER_ENGINE,
+) -> None:
     """
     Compute the following daily products:
         PM10 per sensor orbit
         ICA
+    Args:
+        start_date: first date to process (YYYY-MM-DD)
+        end_date: last date to process (YYYY-MM-DD)
+        workers: number of processes used to run dates in parallel
+        prefetch: number of dates whose inputs are downloaded in advance
+        raster_engine: engine for raster operations, `grass` or `memory`
     """
+    engine.use_engine(raster_engine)
     estimator = PM10Estimator.load_model(MODEL_PATH)
     log_file = f"{PROCESSED_DATA_PATH}/log.txt"
     today = dt.datetime.today()
@@ -230,61 +282,292 @@ def daily_pipeline(start_date: str = None, end_date: str = None) -> None:
     if not os.path.exists(viirs_file_path):
         viirs_file_path = get_viirs_dataset_path(today.year - 1)
 
+    logger.info("Processing...")
+    daily_inputs = get_daily_inputs(dates_to_download, prefetch)
+    if workers > 1:
+        new_uncompleted_dates = process_dates_in_parallel(
+            daily_inputs, estimator, viirs_file_path, workers, raster_engine
+        )
+    else:
+        total_cells = setup_daily_processing()
+        new_uncompleted_dates = [
+            date
+            for date, downloaded in daily_inputs
+            if not process_date(
+                date, estimator, viirs_file_path, total_cells, downloaded
+            )
+        ]
+
+    update_log_data(dates_to_download, log_file, new_uncompleted_dates)
+    logger.info(f"Download cache: {pop_cache_report()}")
+    logger.info(f"Granules outside the region: {pop_skip_report()}")
+
+
+def download_daily_inputs(date: str) -> bool:
+    """
+    Download MAIAC and MERRA inputs for a given date
+    Args:
+        date: date to download (YYYY-MM-DD)
+    Return:
+        True if there are MAIAC files to be processed, False otherwise
+    """
+    logger.info(f"Downloading inputs for {date}...")
+    if not get_modis_files(
+        MAIAC_PRODUCT,
+        MAIAC_COLLECTION,
+        start_date=date,
+        tile_index=get_maiac_tile_index(),
+        **MODIS_REGION,  # type: ignore
+    ):
+        return False
+
+    get_all_merra_files(date, MERRA_DATASETS)
+    logger.info(f"Inputs for {date} are ready")
+    return True
+
+
+def get_daily_inputs(
+    dates: List[str], ahead: int
+) -> Iterator[Tuple[str, Optional[bool]]]:
+    """
+    Get the dates to process along with the state of their inputs
+    Args:
+        dates: dates to process (YYYY-MM-DD)
+        ahead: number of dates to download in advance, 0 to download inline
+    Yields:
+        Date and whether its inputs were downloaded (None if not prefetched)
+    """
+    if ahead > 0:
+        yield from prefetch(dates, download_daily_inputs, ahead)
+    else:
+        yield from ((date, None) for date in dates)
+
+
+def setup_daily_processing() -> int:
+    """
+    Set domain and mask of the current mapset
+    Return:
+        Total cells of the domain
+    """
     logger.info("Setting domain...")
-    set_domain(DOMAIN_DATA_PATH)
-    apply_mask_result = apply_mask(REGION_DATA_PATH)
-    total_cells = get_total_cells(apply_mask_result)
+    engine.set_domain(DOMAIN_DATA_PATH)
+    apply_mask_result = engine.apply_mask(REGION_DATA_PATH)
+    return get_total_cells(apply_mask_result)
 
-    logger.info("Processing...")
-    new_uncompleted_dates = []
-    for date in dates_to_download:
-        logger.info(f"Date: {date}")
-        processed_dir_path = f"{PROCESSED_DATA_PATH}/{date}/"
-        try:
-            if not os.path.exists(processed_dir_path):
-                os.mkdir(processed_dir_path)
 
-            prediction_dir_path = f"{PREDICTION_DATA_PATH}/{date}/"
-            if not os.path.exists(prediction_dir_path):
-                os.mkdir(prediction_dir_path)
+def process_date(
+    date: str,
+    estimator: Any,
+    viirs_file_path: str,
+    total_cells: int,
+    downloaded: Optional[bool] = None,
+) -> bool:
+    """
+    Compute daily products for a given date. Finished stages are recorded in
+    the date manifest, so a rerun only executes stale or missing stages.
+    Args:
+        date: date to process (YYYY-MM-DD)
+        estimator: model object to estimate PM10
+        viirs_file_path: VIIRS feature file
+        total_cells: total cells of the domain
+        downloaded: whether inputs were already downloaded, None to download them
+    Return:
+        False if the date has to be processed again, True otherwise
+    """
+    logger.info(f"Date: {date}")
+    processed_dir_path = f"{PROCESSED_DATA_PATH}/{date}/"
+    completed = True
+    try:
+        if not os.path.exists(processed_dir_path):
+            os.mkdir(processed_dir_path)
+
+        prediction_dir_path = f"{PREDICTION_DATA_PATH}/{date}/"
+        if not os.path.exists(prediction_dir_path):
+            os.mkdir(prediction_dir_path)
+
+        if downloaded is None:
+            logger.info("Downloading MAIAC and MERRA data...")
+            downloaded = download_daily_inputs(date)
+        if not downloaded:
+            logger.info(f"NO MAIAC files to process for {date}")
+            return completed
+
+        manifest = StageManifest.load(f"{processed_dir_path}{MANIFEST_FILENAME}")
+        current_maiac_path = f"{MODIS_DATASET_PATH}/{MAIAC_PRODUCT}/{date}/"
+        modis_fingerprint = fingerprint(
+            glob.glob(f"{current_maiac_path}*.hdf"),
+            MAIAC_BANDS,
+            MIN_PERCENTAGE_OF_VALID_DATA,
+        )
+        merra_fingerprint = fingerprint(get_merra_paths(date))
+        inputs_fingerprint = fingerprint(
+            [MODEL_PATH, viirs_file_path], modis_fingerprint, merra_fingerprint
+        )
+        if manifest.is_done(ICA_STAGE, DATE_KEY, inputs_fingerprint):
+            logger.info(f"Daily products for {date} are up to date")
+            return completed
+
+        logger.info("Processing MAIAC data...")
+        modis_outputs = process_modis_data(
+            current_maiac_path,
+            processed_dir_path,
+            total_cells,
+            manifest,
+            modis_fingerprint,
+        )
+        if not modis_outputs:
+            return completed
 
-            logger.info("Downloading MAIAC data...")
-            current_maiac_path = f"{MODIS_DATASET_PATH}/{MAIAC_PRODUCT}/{date}/"
-            modis_outputs = process_modis_data(
-                current_maiac_path, date, processed_dir_path, total_cells
-            )
-            if not modis_outputs:
-                continue
+        logger.info("Processing MERRA data...")
+        ready_outputs = process_merra_data(
+            date, modis_outputs, processed_dir_path, manifest, merra_fingerprint
+        )
 
-            logger.info("Downloading MERRA data...")
-            process_merra_data(date, modis_outputs, processed_dir_path)
-
-            logger.info("Computing PM10...")
-            creation_date, log_prediction, min_date = computing_pm_10(
-                current_maiac_path,
-                modis_outputs,
-                estimator,
-                prediction_dir_path,
-                processed_dir_path,
-                viirs_file_path,
-            )
+        if len(ready_outputs) < len(modis_outputs):
+            # Orbits with features are computed anyway, so a retry only
+            # has to process the missing ones
+            if ready_outputs:
+                logger.info("Computing PM10...")
+                computing_pm_10(
+                    current_maiac_path,
+                    ready_outputs,
+                    estimator,
+                    prediction_dir_path,
+                    processed_dir_path,
+                    viirs_file_path,
+                    manifest,
+                    inputs_fingerprint,
+                )
+            raise Exception("MERRA features are missing for some orbits")
+
+        logger.info("Computing PM10...")
+        creation_date, log_prediction, min_date = computing_pm_10(
+            current_maiac_path,
+            modis_outputs,
+            estimator,
+            prediction_dir_path,
+            processed_dir_path,
+            viirs_file_path,
+            manifest,
+            inputs_fingerprint,
+        )
 
-            logger.info("Computing ICA...")
-            computing_ica(
-                creation_date,
-                log_prediction,
-                min_date,
-                prediction_dir_path,
-                processed_dir_path,
-            )
+        logger.info("Computing ICA...")
+        computing_ica(
+            creation_date,
+            log_prediction,
+            min_date,
+            prediction_dir_path,
+            processed_dir_path,
+        )
+        manifest.mark_done(
+            ICA_STAGE,
+            DATE_KEY,
+            inputs_fingerprint,
+            [f"{prediction_dir_path}log.txt"],
+        )
 
-        except Exception as e:
-            logger.error(f"Uncompleted process: {e}")
-            new_uncompleted_dates.append(date)
+    except Exception as e:
+        logger.error(f"Uncompleted process: {e}")
+        completed = False
 
+    logger.info(
+        f"GRASS module launches saved for {date}: {engine.pop_launches_saved()}"
+    )
+    # Intermediate files are kept to resume uncompleted dates
+    if completed:
         delete_intermediate_files(processed_dir_path)
+    return completed
+
+
+_worker_context: Dict[str, Any] = {}
+
+
+def init_daily_worker(estimator: Any, raster_engine: str) -> None:
+    """
+    Prepare a worker process: switch to its own mapset and set domain and mask
+    Args:
+        estimator: model object to estimate PM10
+        raster_engine: engine for raster operations
+    """
+    engine.use_engine(raster_engine)
+    engine.init_worker_mapset()
+    _worker_context["estimator"] = estimator
+    _worker_context["total_cells"] = setup_daily_processing()
+
+
+def process_date_in_worker(
+    date: str, viirs_file_path: str, downloaded: Optional[bool]
+) -> Tuple[bool, Counter, Counter]:
+    """
+    Process a date in a worker. The download cache and skipped granules
+    counts of the worker are returned, to report them once for the whole run.
+    """
+    completed = process_date(
+        date, viirs_file_path=viirs_file_path, downloaded=downloaded, **_worker_context
+    )
+    return completed, pop_cache_counts(), pop_skip_counts()
 
-    update_log_data(dates_to_download, log_file, new_uncompleted_dates)
+
+def process_dates_in_parallel(
+    daily_inputs: Iterable[Tuple[str, Optional[bool]]],
+    estimator: Any,
+    viirs_file_path: str,
+    workers: int,
+    raster_engine: str,
+) -> List[str]:
+    """
+    Compute daily products of many dates in a process pool
+    Args:
+        daily_inputs: dates to process (YYYY-MM-DD) and the state of their inputs
+        estimator: model object to estimate PM10
+        viirs_file_path: VIIRS feature file
+        workers: number of processes
+        raster_engine: engine for raster operations
+    Return:
+        Uncompleted dates
+    """
+    uncompleted_dates = []
+    try:
+        # Workers are not forked from this process, which runs the prefetch
+        # threads and could hand them a lock held by one of those threads
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("forkserver"),
+            initializer=init_daily_worker,
+            initargs=(estimator, raster_engine),
+        ) as executor:
+            # A date is taken from the inputs only when a worker is free, so
+            # prefetched downloads stay at most `ahead` dates beyond processing
+            inputs = iter(daily_inputs)
+            futures: Dict[Future, str] = {}
+
+            def submit_next(n: int) -> None:
+                for date, downloaded in itertools.islice(inputs, n):
+                    future = executor.submit(
+                        process_date_in_worker, date, viirs_file_path, downloaded
+                    )
+                    futures[future] = date
+
+            submit_next(workers)
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    date = futures.pop(future)
+                    try:
+                        completed, cache_counts, skip_counts = future.result()
+                        add_cache_counts(cache_counts)
+                        add_skip_counts(skip_counts)
+                        if not completed:
+                            uncompleted_dates.append(date)
+                    except Exception as e:
+                        logger.error(f"Uncompleted process for {date}: {e}")
+                        uncompleted_dates.append(date)
+                submit_next(len(done))
+    finally:
+        engine.remove_worker_mapsets()
+
+    return uncompleted_dates
 
 
 def update_log_data(
@@ -318,27 +601,30 @@ def computing_ica(
     daily_predictions = sorted(glob.glob(pattern))
     products = []
     ica_rasters = []
-    for e, dp in enumerate(daily_predictions):
-        rname = f"daily_prediction_{e}"
-        ica_rasters.append(rname)
-        # Import to GRASS
-        import_gtiff(dp, rname)
-        products.append(dp.split("/")[-1].split(".")[0])
-    refresh_region()
     ica_file = f"{ICA_PATH}_{min_date.strftime('%Y%m%d')}_v001"
     ica_dir = f"{prediction_dir_path}{ica_file}/"
     if not os.path.exists(ica_dir):
         os.mkdir(ica_dir)
-    # Compute daily mean
-    compute_mean(ica_rasters, "daily_ica")
+    with engine.command_batch("ica_mean"):
+        for e, dp in enumerate(daily_predictions):
+            rname = f"daily_prediction_{e}"
+            ica_rasters.append(rname)
+            # Import to GRASS
+            engine.import_gtiff(dp, rname)
+            products.append(dp.split("/")[-1].split(".")[0])
+        engine.refresh_region()
+        # Compute daily mean
+        engine.compute_mean(ica_rasters, "daily_ica")
     # Reclassified prediction
     rname = "ICA"
-    discretize_values("daily_ica", get_qa_class, rname)
-    _max, _min = get_ranges(rname)
+    ica_table = BreakpointTable(
+        ICA_BREAKPOINTS, read_color_rules_values(ICA_COLOR_RULES_PATH), NODATA
+    )
+    engine.discretize_values("daily_ica", ica_table, rname)
     # Export Gtiff
-    reset_color_table(rname, ICA_COLOR_RULES_PATH)
-    export_multiband_gtiff([rname], ica_file, f"{ica_dir}{ica_file}", NODATA)
-    # raster2gtiff(rname, f"{p_dir}{ica_file}")
+    engine.reset_color_table(rname, ICA_COLOR_RULES_PATH)
+    engine.export_multiband_gtiff([rname], ica_file, f"{ica_dir}{ica_file}", NODATA)
+    _max, _min = get_stats_ranges(read_stats(f"{ica_dir}{ica_file}"), rname)
     # Create XML
     metadata = dict(
         zip(
@@ -357,7 +643,7 @@ def computing_ica(
     # Uncomment to use metadata
     # create_xml(ICA_TEMPLATE_PATH, metadata, f"{ica_dir}{ica_file}")
     # Export PNG
-    raster2png(rname, f"{ica_dir}{ica_file}")
+    engine.raster2png(rname, f"{ica_dir}{ica_file}")
     # Remove aux.xml temporary files
     remove_file(f"{ica_dir}/{ica_file}.aux.xml")
     # Zip directory with all product
@@ -373,161 +659,395 @@ def computing_pm_10(
     prediction_dir_path: str,
     processed_dir_path: str,
     viirs_file_path: str,
+    manifest: StageManifest,
+    inputs_fingerprint: str,
 ) -> Tuple[str, DefaultDict[Any, List], dt.datetime]:
     log_prediction = defaultdict(list)  # type: ignore
     creation_date = dt.datetime.today().strftime("%Y-%m-%dT%H:%M:%S")
+    failed_orbits = []
     for modis_orbit in modis_outputs:
         aod_file, sensor, min_date = modis_orbit.values()
-        pattern = f"{processed_dir_path}*_{min_date.hour}_{sensor}.tif"
-        features_files = sorted(glob.glob(pattern))
-        features_files.pop(1)  # remove AOD_QA
-        features_files.insert(4, str(DOMAIN_DATA_PATH))
-        features_files.append(str(viirs_file_path))
-        # Predict PM10
+        orbit_key = f"{min_date.hour}_{sensor}"
         pm10_file_path = (
             f"{PM10_PREFIX_FILENAME}_{min_date.strftime('%Y%m%d_%H%M%S')}_v001"
         )
-        predict(estimator, features_files, f"{processed_dir_path}{pm10_file_path}")
         pm10_file = f"{processed_dir_path}{pm10_file_path}.tif"
-        log_prediction[sensor].append(pm10_file)
+        pm10_dir = f"{prediction_dir_path}{pm10_file_path}/"
+        try:
+            old_prediction, old_fingerprint = None, None
+            if manifest.is_done(PREDICTION_STAGE, orbit_key, inputs_fingerprint):
+                logger.info(f"Prediction for {orbit_key} already computed")
+            else:
+                if os.path.exists(pm10_file):
+                    old_fingerprint = fingerprint([pm10_file])
+                    old_prediction = read_prediction(
+                        pm10_file, engine.get_region_mask()
+                    )
+                pattern = f"{processed_dir_path}*_{min_date.hour}_{sensor}.tif"
+                features_files = sorted(glob.glob(pattern))
+                features_files.pop(1)  # remove AOD_QA
+                features_files.insert(4, str(DOMAIN_DATA_PATH))
+                features_files.append(str(viirs_file_path))
+                # Predict PM10
+                predict(
+                    estimator, features_files, f"{processed_dir_path}{pm10_file_path}"
+                )
+                manifest.mark_done(
+                    PREDICTION_STAGE, orbit_key, inputs_fingerprint, [pm10_file]
+                )
+            update_monthly_accumulator(
+                sensor, min_date, pm10_file, old_prediction, old_fingerprint
+            )
+
+            if manifest.is_done(EXPORT_STAGE, orbit_key, inputs_fingerprint):
+                logger.info(f"Products for {orbit_key} already exported")
+            else:
+                export_pm10_products(
+                    current_maiac_path,
+                    aod_file,
+                    pm10_file,
+                    pm10_file_path,
+                    pm10_dir,
+                    min_date,
+                    creation_date,
+                )
+                manifest.mark_done(
+                    EXPORT_STAGE,
+                    orbit_key,
+                    inputs_fingerprint,
+                    [
+                        f"{pm10_dir}{pm10_file_path}.tif",
+                        f"{pm10_dir}{pm10_file_path}.png",
+                    ],
+                )
+            log_prediction[sensor].append(pm10_file)
+        except Exception as e:
+            logger.error(f"Uncompleted orbit {orbit_key}: {e}")
+            failed_orbits.append(orbit_key)
+
+    if failed_orbits:
+        raise Exception(f"PM10 was not computed for orbits: {', '.join(failed_orbits)}")
+
+    return creation_date, log_prediction, min_date
+
+
+def update_monthly_accumulator(
+    sensor: str,
+    min_date: dt.datetime,
+    pm10_file: str,
+    old_prediction: Optional[np.ndarray],
+    old_fingerprint: Optional[str],
+) -> None:
+    """
+    Add a daily PM10 prediction to the accumulator of its month. Nothing is
+    done if the accumulator already holds this version of the prediction.
+    Args:
+        sensor: sensor type
+        min_date: orbit date
+        pm10_file: predicted PM10 file of the orbit
+        old_prediction: values of the prediction it replaces, if any
+        old_fingerprint: fingerprint of the prediction it replaces, if any
+    """
+    mask = engine.get_region_mask()
+    path = get_monthly_accumulator_path(
+        MONTHLY_ACCUMULATORS_PATH, sensor, min_date.year, min_date.month
+    )
+    with open_accumulator(path, mask.shape) as acc:
+        if acc.holds(pm10_file):
+            return
+
+        acc.update(
+            pm10_file,
+            read_prediction(pm10_file, mask),
+            old_prediction,
+            old_fingerprint,
+        )
+
+
+def export_pm10_products(
+    current_maiac_path: str,
+    aod_file: str,
+    pm10_file: str,
+    pm10_file_path: str,
+    pm10_dir: str,
+    min_date: dt.datetime,
+    creation_date: str,
+) -> None:
+    """
+    Export GTiff, PNG and zip of the PM10 product of an orbit
+    Args:
+        current_maiac_path: directory of the MAIAC HDF files
+        aod_file: AOD_QA mosaic file of the orbit
+        pm10_file: predicted PM10 file of the orbit
+        pm10_file_path: product name
+        pm10_dir: product directory
+        min_date: orbit date
+        creation_date: product creation date
+    """
+    if not os.path.exists(pm10_dir):
+        os.mkdir(pm10_dir)
+
+    pm10_band_name = "PM10"
+    aod_band_name = "QA_AOD"
+    with engine.command_batch("pm10_export"):
         # Get prediction file
-        pm10_band_name = "PM10"
-        import_gtiff(pm10_file, pm10_band_name)
-        _max, _min = get_ranges(pm10_band_name)
-        reset_color_table(pm10_band_name, PM10_COLOR_RULES_PATH)
+        engine.import_gtiff(pm10_file, pm10_band_name)
+        engine.reset_color_table(pm10_band_name, PM10_COLOR_RULES_PATH)
         # Get AOD associated
-        aod_band_name = "QA_AOD"
-        import_gtiff(aod_file, aod_band_name)
-        _max2, _min2 = get_ranges(aod_band_name)
+        engine.import_gtiff(aod_file, aod_band_name)
         # Export Gtiff
-        pm10_dir = f"{prediction_dir_path}{pm10_file_path}/"
-        if not os.path.exists(pm10_dir):
-            os.mkdir(pm10_dir)
-
-        refresh_region()
-        export_multiband_gtiff(
+        engine.refresh_region()
+        engine.export_multiband_gtiff(
             [pm10_band_name, aod_band_name],
             pm10_file_path,
             f"{pm10_dir}{pm10_file_path}",
             NODATA,
         )
-        # Create XML
-        maiac_files = [
-            os.path.basename(x) for x in glob.glob(f"{current_maiac_path}*.hdf")
-        ]
-        merra_files = [
-            fname.format(min_date.strftime("%Y%m%d"))
-            for fname in XML_MERRA_PRODUCT_NAMES
-        ]
-        metadata = dict(
-            zip(
-                DAILY_PM10_METADATA_CODES.values(),
-                [
-                    pm10_file_path,
-                    creation_date,
-                    _max,
-                    _min,
-                    _max2,
-                    _min2,
-                    ", ".join(maiac_files),
-                    ", ".join(merra_files),
-                    XML_VIIRS_NAME.format(min_date.year),
-                ],
-            )
+    stats = read_stats(f"{pm10_dir}{pm10_file_path}")
+    _max, _min = get_stats_ranges(stats, pm10_band_name)
+    _max2, _min2 = get_stats_ranges(stats, aod_band_name)
+    # Create XML
+    maiac_files = [os.path.basename(x) for x in glob.glob(f"{current_maiac_path}*.hdf")]
+    merra_files = [
+        fname.format(min_date.strftime("%Y%m%d")) for fname in XML_MERRA_PRODUCT_NAMES
+    ]
+    metadata = dict(
+        zip(
+            DAILY_PM10_METADATA_CODES.values(),
+            [
+                pm10_file_path,
+                creation_date,
+                _max,
+                _min,
+                _max2,
+                _min2,
+                ", ".join(maiac_files),
+                ", ".join(merra_files),
+                XML_VIIRS_NAME.format(min_date.year),
+            ],
         )
-        # Uncomment to use metadata
-        # create_xml(DAILY_PM10_TEMPLATE_PATH, metadata, f"{pm10_dir}{pm10_file_path}")
-        # Export PNG
-        raster2png(pm10_band_name, f"{pm10_dir}{pm10_file_path}")
-        # Remove aux.xml temporary files
-        remove_file(f"{pm10_dir}/{pm10_file_path}.aux.xml")
-        # Zip directory with all product
-        zip_directory(pm10_dir, pm10_dir)
-    return creation_date, log_prediction, min_date
+    )
+    # Uncomment to use metadata
+    # create_xml(DAILY_PM10_TEMPLATE_PATH, metadata, f"{pm10_dir}{pm10_file_path}")
+    # Export PNG
+    engine.raster2png(pm10_band_name, f"{pm10_dir}{pm10_file_path}")
+    # Remove aux.xml temporary files
+    remove_file(f"{pm10_dir}/{pm10_file_path}.aux.xml")
+    # Zip directory with all product
+    zip_directory(pm10_dir, pm10_dir)
+
 
+def get_merra_paths(date: str) -> List[str]:
+    """
+    Get the MERRA files of a given date
+    """
+    return [
+        f"{MERRA_DATASET_PATH}/{dataset['shortname']}/{date}/{dataset['product']}.nc"
+        for dataset in MERRA_DATASETS
+    ]
 
-def process_merra_data(date: str, modis_outputs: List[Any], processed_dir: str) -> None:
+
+def read_merra_cubes(date: str) -> Dict[str, MerraCube]:
+    """
+    Read every MERRA file of a date once. A file that can not be read is
+    downloaded again once.
+    Args:
+        date: date to process (YYYY-MM-DD)
+    Returns:
+        Cubes by MERRA product shortname
+    """
+    cubes = {}
     for dataset in MERRA_DATASETS:
-        shortname = dataset.get("shortname", "")
-        product = dataset.get("product", "")
-        variables = dataset.get("variables", [])
-        get_merra_files(date, **dataset)  # type: ignore
-        # Import to GRASS to reproject and rescale
-        for modis_orbit, var in itertools.product(modis_outputs, variables):
-            _, sensor, min_date = modis_orbit.values()
-            current_merra_path = (
-                f"NETCDF:{MERRA_DATASET_PATH}/{shortname}/" f"{date}/{product}.nc:{var}"
-            )
-            merra_band = (int(min_date.hour) % 12) + 1
-            if shortname == MERRA_SHORTNAME:
-                merra_band = (math.trunc(int(min_date.hour) / 3) + 1) - 4
+        shortname = str(dataset["shortname"])
+        product = str(dataset["product"])
+        variables = list(dataset["variables"])
+        merra_file = f"{MERRA_DATASET_PATH}/{shortname}/{date}/{product}.nc"
+        try:
+            cubes[shortname] = MerraCube.read(merra_file, variables)
+        except Exception as e:
+            logger.warning(f"Could not read {merra_file}, downloading it again: {e}")
+            remove_file(merra_file)
+            get_merra_files(date, **dataset)  # type: ignore
+            cubes[shortname] = MerraCube.read(merra_file, variables)
 
-            rname = f"{var}_{min_date.hour}_{sensor}"
-            rofile = f"{processed_dir}{rname}"
-            remove_mask()
-            try:
-                import_netcdf(current_merra_path, merra_band, rname)
-            except Exception:
-                os.remove(f"{MERRA_DATASET_PATH}/{shortname}/{date}/{product}.nc")
-                get_merra_files(date, **dataset)  # type: ignore
-                import_netcdf(current_merra_path, merra_band, rname)
-
-            get_resampling(rname)
-            apply_mask(REGION_DATA_PATH)
-            refresh_region()
-            raster2gtiff(rname, rofile)
-    return None
+    return cubes
+
+
+def process_merra_data(
+    date: str,
+    modis_outputs: List[Any],
+    processed_dir: str,
+    manifest: StageManifest,
+    merra_fingerprint: str,
+) -> List[Any]:
+    """
+    Export MERRA features for each orbit. The MERRA files are read once and
+    the bands of every orbit are regridded to the domain at once.
+    Return:
+        Orbits whose features are ready
+    """
+    ready_outputs = []
+    pending_orbits = {}
+    for modis_orbit in modis_outputs:
+        _, sensor, min_date = modis_orbit.values()
+        orbit_key = f"{min_date.hour}_{sensor}"
+        if manifest.is_done(MERRA_STAGE, orbit_key, merra_fingerprint):
+            logger.info(f"MERRA features for {orbit_key} already exported")
+            ready_outputs.append(modis_orbit)
+        else:
+            pending_orbits[orbit_key] = modis_orbit
+
+    if not pending_orbits:
+        return ready_outputs
+
+    try:
+        cubes = read_merra_cubes(date)
+    except Exception as e:
+        logger.error(f"MERRA files for {date} could not be read: {e}")
+        return ready_outputs
+
+    domain = get_domain_profile(DOMAIN_DATA_PATH)
+    mask = engine.get_region_mask()
+    outputs = defaultdict(list)  # type: ignore
+    for shortname, cube in cubes.items():
+        bands = {
+            orbit_key: get_merra_band(shortname, modis_orbit["date"].hour)
+            for orbit_key, modis_orbit in pending_orbits.items()
+        }
+        bands = {k: band for k, band in bands.items() if 1 <= band <= cube.times}
+        if not bands:
+            continue
+
+        # Regrid the variables of every orbit in a single step
+        regridder = BilinearRegridder.load(
+            REGRID_CACHE_PATH,
+            cube.transform,
+            cube.data.shape[-2:],
+            domain["transform"],
+            mask.shape,
+        )
+        features = regridder.regrid(cube.slice_bands(list(bands.values())))
+        features[:, :, ~mask] = np.nan
+
+        for orbit_key, orbit_features in zip(bands, features):
+            for var, values in zip(cube.variables, orbit_features):
+                rfile = f"{processed_dir}{var}_{orbit_key}.tif"
+                write_domain_gtiff(values, rfile, domain)
+                outputs[orbit_key].append(rfile)
+
+    n_features = sum(len(cube.variables) for cube in cubes.values())
+    for orbit_key, modis_orbit in pending_orbits.items():
+        if len(outputs[orbit_key]) != n_features:
+            logger.error(f"MERRA features for {orbit_key} were not exported")
+            continue
+
+        # The inputs recorded are the ones checked before the stage ran
+        manifest.mark_done(
+            MERRA_STAGE, orbit_key, merra_fingerprint, outputs[orbit_key]
+        )
+        ready_outputs.append(modis_orbit)
+
+    return [orbit for orbit in modis_outputs if orbit in ready_outputs]
 
 
 def process_modis_data(
-    current_maiac_path: str, date: str, processed_dir_path: str, total_cells: int
+    current_maiac_path: str,
+    processed_dir_path: str,
+    total_cells: int,
+    manifest: StageManifest,
+    modis_fingerprint: str,
 ) -> List[Any]:
-    if not get_modis_files(
-        MAIAC_PRODUCT,
-        MAIAC_COLLECTION,
-        start_date=date,
-        **MODIS_REGION,  # type: ignore
-    ):
-        return []
-    null_files = []  # type: ignore
+    if manifest.is_done(MODIS_STAGE, DATE_KEY, modis_fingerprint):
+        logger.info("MODIS mosaics already computed")
+        return [
+            {
+                "file": orbit["file"],
+                "sensor": orbit["sensor"],
+                "date": dt.datetime.fromisoformat(orbit["date"]),
+            }
+            for orbit in manifest.get_data(MODIS_STAGE, DATE_KEY)["orbits"]
+        ]
+
+    region = RegionGrid(get_domain_profile(DOMAIN_DATA_PATH), engine.get_region_mask())
+    # Both MAIAC bands are read from each HDF at once and interpolated
+    # straight onto the domain grid
+    mosaics = get_modis_mosaics(
+        current_maiac_path,
+        MAIAC_BANDS,
+        region,
+        str(REGRID_CACHE_PATH),
+        processed_dir_path,
+        get_maiac_tile_index(),
+    )
+    qa_prefix = list(MAIAC_BANDS.values())[-1]
     modis_outputs = []  # type: ignore
-    for band, prefix in MAIAC_BANDS.items():
-        modis_outputs = get_modis_mosaic(
-            current_maiac_path, band, prefix, processed_dir_path
-        )
-        # Import to GRASS to reproject and rescale
-        orbits_to_clean = []
-        for modis_orbit in modis_outputs:
-            rfile, sensor, min_date = modis_orbit.values()
-            sufix = f"{min_date.hour}_{sensor}"
-            logger.info(f"Current sufix: {sufix}")
+    for mosaic in mosaics:
+        sensor, min_date = mosaic["sensor"], mosaic["date"]
+        sufix = f"{min_date.hour}_{sensor}"
+        logger.info(f"Current sufix: {sufix}")
+
+        # Valid cells are counted from the mosaic arrays, inside the region
+        enough_valid_data = True
+        for prefix in MAIAC_BANDS.values():
             rname = f"{prefix}_{sufix}"
-            import_gtiff(rfile, rname)
-            refresh_region()
+            valid_cells = mosaic["valid_cells"][prefix]
+            logger.info(f"{rname}: {valid_cells} valid cells of {total_cells}")
+            null_values = total_cells - valid_cells
+            if not enough_valid_data_has_been_collected(total_cells, null_values):
+                logger.info(
+                    f"The current file {rname} won't be processed because the "
+                    f"{MIN_PERCENTAGE_OF_VALID_DATA}% floor of non-null cells was not "
+                    "reached"
+                )
+                enough_valid_data = False
+                break
+        if not enough_valid_data:
+            continue
+
+        rnames = ", ".join(f"{prefix}_{sufix}" for prefix in mosaic["files"])
+        logger.info(f"The current files {rnames} will be processed")
+        modis_outputs.append(
+            {"file": mosaic["files"][qa_prefix], "sensor": sensor, "date": min_date}
+        )
 
-            error_message_in_mosaic = (
-                f"The current file {rname} won't be processed because the "
-                f"{MIN_PERCENTAGE_OF_VALID_DATA}% floor of non-null cells was not reached"
-            )
-            if sufix in null_files:
-                logger.info(error_message_in_mosaic)
-                orbits_to_clean.append(modis_orbit)
-                continue
+    manifest.mark_done(
+        MODIS_STAGE,
+        DATE_KEY,
+        modis_fingerprint,
+        [
+            f"{processed_dir_path}{prefix}_{orbit['date'].hour}_{orbit['sensor']}.tif"
+            for orbit in modis_outputs
+            for prefix in MAIAC_BANDS.values()
+        ],
+        {
+            "orbits": [
+                {**orbit, "date": orbit["date"].isoformat()} for orbit in modis_outputs
+            ]
+        },
+    )
+    return modis_outputs
 
-            null_values = get_number_of_null_values(rname)
-            if not enough_valid_data_has_been_collected(total_cells, null_values):
-                null_files.append(sufix)
-                logger.info(error_message_in_mosaic)
-                orbits_to_clean.append(modis_orbit)
-                continue
 
-            logger.info(f"The current file {rname} will be processed")
-            rofile = f"{processed_dir_path}{rname}"
-            raster2gtiff(rname, rofile)
+def export_monthly_png(product: str, rname: str) -> None:
+    """
+    Export the mean of a monthly product to PNG
+    Args:
+        product: monthly product file, without extension
+        rname: raster map name of the mean
+    """
+    with engine.command_batch("monthly_png"):
+        # The mean is the first band of the product
+        engine.import_gtiff(f"{product}.tif", rname, band=1)
+        engine.refresh_region()
+        engine.reset_color_table(rname, PM10_COLOR_RULES_PATH)
+    engine.raster2png(rname, product)
+
 
-        for modis_orbit in orbits_to_clean:
-            modis_outputs.remove(modis_orbit)
-    return modis_outputs
+def get_maiac_tile_index() -> Dict[str, str]:
+    """
+    Get the MAIAC sinusoidal tiles classified against the region
+    """
+    return get_tile_index(REGION_DATA_PATH, DOMAIN_DATA_PATH, TILE_INDEX_CACHE_PATH)
 
 
 def get_dates_to_download_for_a_range(
@@ -579,8 +1099,8 @@ def monthly_pipeline(ndays: int) -> None:
         N
     """
     logger.info("Setting domain...")
-    set_domain(DOMAIN_DATA_PATH)
-    apply_mask(REGION_DATA_PATH)
+    engine.set_domain(DOMAIN_DATA_PATH)
+    engine.apply_mask(REGION_DATA_PATH)
 
     logger.info("Processing...")
     today = dt.datetime.today()
@@ -607,43 +1127,41 @@ def monthly_pipeline(ndays: int) -> None:
         logger.info(f"Data not found for {year}-{month}")
         return None
 
+    domain = get_domain_profile(DOMAIN_DATA_PATH)
+    mask = engine.get_region_mask()
     for sensor in SENSORS:
         logger.info(f"Getting monthly product for {sensor}")
-        products = []
-        rasters = []
-        product_prefix = f"{sensor.lower()}_{year}_{month}"
-        for e, rfile in enumerate(daily_preds[sensor]):
-            rasters.append(f"{product_prefix}_{e}")
-            import_gtiff(rfile, f"{product_prefix}_{e}")
-            products.append(rfile.split("/")[-1].split(".")[0])
-
-        refresh_region()
-        # PM10 monthly mean
-        rname = f"PM10_media_{sensor}"
-        compute_mean(rasters, rname)
-        _max, _min = get_ranges(rname)
-        group = [rname]
-
-        # PM10 monthly standard deviation
-        rname = f"PM10_desvest_{sensor}"
-        compute_stddev(rasters, rname)
-        _max2, _min2 = get_ranges(rname)
-        group.append(rname)
-
-        # Amount of values
-        rname = "PM10_n"
-        get_count(rasters, rname)
-        _max3, _min3 = get_ranges(rname)
-        group.append(rname)
+        products = [rfile.split("/")[-1].split(".")[0] for rfile in daily_preds[sensor]]
+        # PM10 monthly mean, standard deviation and amount of values
+        group = [f"PM10_media_{sensor}", f"PM10_desvest_{sensor}", "PM10_n"]
 
         # Define file name and metadata
-        refresh_region()
         pcode = MONTHLY_PRODUCT_CODES[sensor]
         xml_template = MONTHLY_PRODUCT_TEMPLATES[sensor]
         creation_date = dt.datetime.today().strftime("%Y-%m-%dT%H:%M:%S")
         first_day = "".join(daily_preds[sensor][0].split("/")[-2].split("-"))
         last_day = "".join(daily_preds[sensor][-1].split("/")[-2].split("-"))
         group_name = f"{PM10_PREFIX_FILENAME}m_{first_day}_{last_day}_{pcode}_v001"
+
+        # Create folder to save data
+        output_dir = f"{folder}{group_name}"
+        if not os.path.exists(output_dir):
+            os.mkdir(output_dir)
+
+        # Export Gtiff
+        path = get_monthly_accumulator_path(
+            MONTHLY_ACCUMULATORS_PATH, sensor, int(year), int(month)
+        )
+        with open_accumulator(path, mask.shape) as acc:
+            if not acc.is_up_to_date(daily_preds[sensor]):
+                logger.info(f"Rebuilding accumulator {path}...")
+                acc.rebuild(daily_preds[sensor], mask)
+            acc.export(f"{output_dir}/{group_name}", group, domain, mask, NODATA)
+
+        stats = read_stats(f"{output_dir}/{group_name}")
+        _max, _min = get_stats_ranges(stats, group[0])
+        _max2, _min2 = get_stats_ranges(stats, group[1])
+        _max3, _min3 = get_stats_ranges(stats, group[2])
         metadata = dict(
             zip(
                 MONTHLY_PM10_METADATA_CODES.values(),
@@ -660,25 +1178,18 @@ def monthly_pipeline(ndays: int) -> None:
                 ],
             )
         )
-        # Create folder to save data
-        output_dir = f"{folder}{group_name}"
-        if not os.path.exists(output_dir):
-            os.mkdir(output_dir)
-
-        # Export Gtiff
-        export_multiband_gtiff(group, group_name, f"{output_dir}/{group_name}", NODATA)
 
         # Export XML
         # Uncomment to use metadata
         # create_xml(xml_template, metadata, f"{output_dir}/{group_name}")
 
         # Export PNG only PM10 monthly mean
-        rname = f"PM10_media_{sensor}"
-        reset_color_table(rname, PM10_COLOR_RULES_PATH)
-        raster2png(rname, f"{output_dir}/{group_name}")
+        export_monthly_png(f"{output_dir}/{group_name}", group[0])
 
         # Remove aux.xml temporary files
         remove_file(f"{output_dir}/{group_name}.aux.xml")
 
         # Zip directory with all product
         zip_directory(output_dir, output_dir)
+
+    logger.info(f"GRASS module launches saved: {engine.pop_launches_saved()}")
@@ -1,9 +1,10 @@
 from abc import ABC, abstractmethod
-from typing import Any
+from typing import Any, Iterable, Optional
 
 import attr
 
 from empatia.settings.log import timed
+from empatia.utils.exceptions import IncompleteDownload
 
 
 @attr.s
@@ -29,6 +30,34 @@ class BaseWriter(ABC):
         self.validate_destination()
         self.write(data)
 
+    @timed
+    def stream(
+        self, chunks: Iterable[bytes], expected_size: Optional[int] = None
+    ) -> None:
+        """
+            Calls write_stream with the chunks of data as they are
+            produced, so data does not have to be held in memory at once.
+        """
+        self.validate_directory_path()
+        self.validate_destination()
+        self.write_stream(chunks, expected_size)
+
+    def write_stream(
+        self, chunks: Iterable[bytes], expected_size: Optional[int] = None
+    ) -> None:
+        """
+            Writers that can not write incrementally join the chunks and
+            write them at once. If expected_size is given and the data is
+            shorter or longer, IncompleteDownload is raised and nothing
+            is written.
+        """
+        data = b"".join(chunks)
+        if expected_size is not None and len(data) != expected_size:
+            raise IncompleteDownload(
+                f"{len(data)} of {expected_size} bytes received for {self.destination}"
+            )
+        self.write(data)
+
     @abstractmethod
     def write(self, data: Any) -> None:
         raise NotImplementedError()
@@ -0,0 +1,65 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+import attr
+
+from empatia.utils.files import atomic_write, file_lock
+
+
+@attr.s
+class CatalogCache:
+    """
+    Results of catalog queries by key, each with an optional expiration time.
+    The cache is shared by every process, so it is locked while it is updated.
+    """
+
+    path = attr.ib(type=str)
+
+    def _read(self) -> Dict[str, Dict]:
+        if not os.path.exists(self.path):
+            return {}
+
+        with open(self.path) as json_file:
+            entries: Dict[str, Dict] = json.load(json_file)
+        return entries
+
+    @contextmanager
+    def _entries(self) -> Iterator[Dict[str, Dict]]:
+        with file_lock(self.path):
+            entries = self._read()
+            yield entries
+            with atomic_write(self.path) as tmp_path:
+                with open(tmp_path, "w") as outfile:
+                    json.dump(entries, outfile, indent=4)
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Get the result of a query, None if it is not cached or it expired
+        """
+        # The cache is replaced atomically, so it can be read without lock
+        entry = self._read().get(key)
+
+        if not entry or (entry["expires"] and entry["expires"] < time.time()):
+            return None
+        return entry["value"]
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """
+        Cache the result of a query
+        Args:
+            key: query key
+            value: JSON serializable result
+            ttl: seconds until the result expires, None if it never expires
+        """
+        expires = time.time() + ttl if ttl is not None else None
+        with self._entries() as entries:
+            # Expired entries are dropped, so the cache does not grow forever
+            now = time.time()
+            for old_key in [
+                k for k, e in entries.items() if e["expires"] and e["expires"] < now
+            ]:
+                entries.pop(old_key)
+            entries[key] = {"value": value, "expires": expires}
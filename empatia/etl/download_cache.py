@@ -0,0 +1,176 @@
+import hashlib
+import json
+import os
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+from urllib.parse import urlencode
+
+import attr
+
+from empatia.settings.log import logger
+from empatia.utils.files import atomic_write, file_lock
+
+HIT = "hits"
+MISS = "misses"
+REPAIRED = "repaired"
+
+_report: Counter = Counter()
+_report_lock = threading.Lock()
+
+
+def get_cache_key(url: str, params: Dict = {}) -> str:
+    """
+    Identify a download request
+    Args:
+        url: source url
+        params: download parameters
+    Return:
+        Hex digest of the url and its sorted parameters
+    """
+    query = urlencode(sorted((str(k), str(v)) for k, v in params.items()))
+    return hashlib.sha256(f"{url}?{query}".encode()).hexdigest()
+
+
+def get_checksum(path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@attr.s
+class DownloadCache:
+    """
+    Index of downloaded files by request, with the size and checksum of each
+    file to validate it before it is reused. The index is shared by every
+    process, so it is locked while it is read or updated. Entries of files
+    removed from disk, such as the folders dropped by `clean_storages`, are
+    pruned on every update, so the index only grows with the files kept.
+    """
+
+    path = attr.ib(type=str)
+
+    def _read(self) -> Dict[str, Dict]:
+        if not os.path.exists(self.path):
+            return {}
+
+        with open(self.path) as json_file:
+            entries: Dict[str, Dict] = json.load(json_file)
+        return entries
+
+    @contextmanager
+    def _entries(self) -> Iterator[Dict[str, Dict]]:
+        with file_lock(self.path):
+            entries = self._read()
+            for key in [k for k, e in entries.items() if not os.path.exists(e["path"])]:
+                entries.pop(key)
+            yield entries
+            with atomic_write(self.path) as tmp_path:
+                with open(tmp_path, "w") as outfile:
+                    json.dump(entries, outfile, indent=4)
+
+    def is_valid(
+        self,
+        key: str,
+        destination: str,
+        size: Optional[int] = None,
+        sha256: Optional[str] = None,
+    ) -> bool:
+        """
+        Check if the file of a request was downloaded and is intact.
+        A file on disk that is not in the index is added to it if it has the
+        expected size and checksum, or if they are unknown.
+        Missing or corrupt files are removed from the index and counted as
+        a miss or a repair in the cache report.
+        Args:
+            key: request key
+            destination: downloaded file
+            size: expected size of the file in bytes, if known
+            sha256: expected checksum of the file, if known
+        """
+        # The index is replaced atomically, so it can be read without lock
+        entry = self._read().get(key)
+        if not entry:
+            if os.path.exists(destination) and matches(destination, size, sha256):
+                logger.info(f"{destination} is not in the download cache, adding it")
+                self.add(key, destination)
+                count(HIT)
+                return True
+
+            count(MISS)
+            return False
+
+        if (
+            entry["path"] == destination
+            and os.path.exists(destination)
+            and os.path.getsize(destination) == entry["size"]
+            and get_checksum(destination) == entry["sha256"]
+        ):
+            count(HIT)
+            return True
+
+        if os.path.exists(entry["path"]):
+            logger.info(f"Cached file {entry['path']} is corrupt, repairing it")
+            count(REPAIRED)
+        else:
+            count(MISS)
+        with self._entries() as entries:
+            entries.pop(key, None)
+        return False
+
+    def add(self, key: str, destination: str) -> None:
+        """
+        Record the file of a request
+        Args:
+            key: request key
+            destination: downloaded file
+        """
+        entry = {
+            "path": destination,
+            "size": os.path.getsize(destination),
+            "sha256": get_checksum(destination),
+        }
+        with self._entries() as entries:
+            entries[key] = entry
+
+
+def matches(path: str, size: Optional[int], sha256: Optional[str]) -> bool:
+    """
+    Check a file against its expected size and checksum, the unknown ones are
+    not checked
+    """
+    return (size is None or os.path.getsize(path) == size) and (
+        sha256 is None or get_checksum(path) == sha256
+    )
+
+
+def count(event: str) -> None:
+    with _report_lock:
+        _report[event] += 1
+
+
+def pop_cache_counts() -> Counter:
+    """
+    Get the cache events since the last call, to merge them into the report of
+    another process
+    """
+    with _report_lock:
+        counts = _report.copy()
+        _report.clear()
+    return counts
+
+
+def add_cache_counts(counts: Counter) -> None:
+    with _report_lock:
+        _report.update(counts)
+
+
+def pop_cache_report() -> str:
+    """
+    Get the cache hits, misses and repairs since the last call
+    """
+    counts = pop_cache_counts()
+    return ", ".join(f"{counts[e]} {e}" for e in (HIT, MISS, REPAIRED))
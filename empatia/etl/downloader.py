@@ -1,16 +1,75 @@
-from typing import Dict
+import os
+import threading
+import time
+from typing import Dict, Optional
 
 import requests
-from requests.exceptions import HTTPError
+from requests.adapters import HTTPAdapter
+from requests.exceptions import (
+    ChunkedEncodingError,
+    ConnectionError,
+    HTTPError,
+    Timeout,
+)
+from urllib3.util.retry import Retry
 
+from empatia.etl.download_cache import DownloadCache, get_cache_key
 from empatia.etl.file_writer import FileWriter
+from empatia.settings import DOWNLOAD_CACHE_PATH
+from empatia.settings.constants import (
+    DOWNLOAD_BACKOFF_FACTOR,
+    DOWNLOAD_CHUNK_SIZE,
+    DOWNLOAD_MAX_CONNECTIONS_PER_HOST,
+    DOWNLOAD_RETRIES,
+)
 from empatia.settings.log import logger
-from empatia.utils.exceptions import FileExists
+from empatia.utils.exceptions import FileExists, IncompleteDownload
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+RESUMABLE_ERRORS = (ChunkedEncodingError, ConnectionError, Timeout, IncompleteDownload)
+
+_sessions: Dict[int, requests.Session] = {}
+_sessions_lock = threading.Lock()
+_cache = DownloadCache(str(DOWNLOAD_CACHE_PATH))
+
+
+def get_session() -> requests.Session:
+    """
+    Get the HTTP session of the current process. Connections are pooled per
+    host, up to DOWNLOAD_MAX_CONNECTIONS_PER_HOST at once, and failed requests
+    are retried with exponential backoff.
+    """
+    pid = os.getpid()
+    with _sessions_lock:
+        if pid not in _sessions:
+            retry = Retry(
+                total=DOWNLOAD_RETRIES,
+                backoff_factor=DOWNLOAD_BACKOFF_FACTOR,
+                status_forcelist=RETRY_STATUSES,
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(
+                pool_maxsize=DOWNLOAD_MAX_CONNECTIONS_PER_HOST,
+                pool_block=True,
+                max_retries=retry,
+            )
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[pid] = session
+
+        return _sessions[pid]
 
 
 def get_data(
-    url: str, dst: str, file_format: str, params: Dict = {}, headers: Dict = {}
-) -> None:
+    url: str,
+    dst: str,
+    file_format: str,
+    params: Dict = {},
+    headers: Dict = {},
+    size: Optional[int] = None,
+    sha256: Optional[str] = None,
+) -> int:
     """
     Download files
     Args:
@@ -19,15 +78,106 @@ def get_data(
         file_format: file extension
         params: download parameters
         header: download header
+        size: expected size of the file in bytes, if known
+        sha256: expected checksum of the file, if known
+    Return:
+        Bytes downloaded, 0 if the file was already downloaded
     """
+    key = get_cache_key(url, params)
+    destination = f"{dst}.{file_format}"
+    if _cache.is_valid(key, destination, size, sha256):
+        logger.info(f"{destination} found in the download cache")
+        return 0
+
+    # Files not found or corrupt in the cache are downloaded again
+    if os.path.exists(destination):
+        os.remove(destination)
+
     try:
         writer = FileWriter(path=dst, file_format=file_format, force=True)
-        response = requests.get(url, params=params, headers=headers)
-        response.raise_for_status()
-        writer(response.content)
-        logger.info(f"Contents of {response.url} written to {writer.destination}")
+        start = time.perf_counter()
+        for attempt in range(DOWNLOAD_RETRIES + 1):
+            try:
+                source = stream_to_writer(url, writer, params, headers)
+                break
+            except RESUMABLE_ERRORS as e:
+                if attempt == DOWNLOAD_RETRIES:
+                    raise
+                logger.info(
+                    f"Download of {url} interrupted at {writer.partial_size} bytes "
+                    f"({e}), resuming"
+                )
+                time.sleep(DOWNLOAD_BACKOFF_FACTOR * 2**attempt)
+
+        elapsed = time.perf_counter() - start
+        _cache.add(key, writer.destination)
+        size = os.path.getsize(writer.destination)
+        logger.info(f"{size} bytes of {source} downloaded in {elapsed:.2f}s")
+        logger.info(f"Contents of {source} written to {writer.destination}")
+        return size
     except FileExists:
         logger.info("Dataset already exists")
+        return 0
     except HTTPError as e:
         logger.error("Data was not downloaded", exc_info=e)
         raise HTTPError
+
+
+def stream_to_writer(
+    url: str, writer: FileWriter, params: Dict = {}, headers: Dict = {}
+) -> str:
+    """
+    Stream a download to a writer, in chunks of DOWNLOAD_CHUNK_SIZE bytes.
+    If a previous transfer was interrupted, only the missing bytes are requested.
+    Args:
+        url: source url
+        writer: writer of the downloaded file
+        params: download parameters
+        headers: download header
+    Return:
+        Final url of the download
+    """
+    offset = writer.partial_size
+    # Products are already compressed, and byte ranges refer to the raw content
+    request_headers = {**headers, "Accept-Encoding": "identity"}
+    if offset:
+        request_headers["Range"] = f"bytes={offset}-"
+
+    with get_session().get(
+        url, params=params, headers=request_headers, stream=True
+    ) as response:
+        if offset and response.status_code == 416:
+            writer.discard_partial()
+            raise IncompleteDownload(f"Partial download of {response.url} is invalid")
+        response.raise_for_status()
+        if offset and response.status_code != 206:
+            logger.info(f"{response.url} can not be resumed, downloading it again")
+            writer.discard_partial()
+            offset = 0
+
+        writer.stream(
+            response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE),
+            get_expected_size(response, offset),
+        )
+        return response.url
+
+
+def get_expected_size(response: requests.Response, offset: int) -> Optional[int]:
+    """
+    Get the final size of a downloaded file, if the server announces it
+    Args:
+        response: streamed response
+        offset: bytes already downloaded, for partial responses
+    """
+    if "Content-Encoding" in response.headers:
+        return None
+
+    content_range = response.headers.get("Content-Range", "")
+    total = content_range.rpartition("/")[2]
+    if response.status_code == 206 and total.isdigit():
+        return int(total)
+
+    content_length = response.headers.get("Content-Length")
+    if content_length:
+        return offset + int(content_length)
+    return None
@@ -1,16 +1,23 @@
 import os
-from typing import Any
+from typing import Any, Iterable, Optional
 
 import attr
 
 from empatia.etl.base_writer import BaseWriter
-from empatia.utils.exceptions import DirDoesntExists, FileExists
+from empatia.utils.exceptions import (
+    DirDoesntExists,
+    FileExists,
+    IncompleteDownload,
+)
 
 
 @attr.s
 class FileWriter(BaseWriter):
     """
     Write implementation to store files locally.
+    Streamed data is appended to a partial file, which is renamed to the
+    destination once it is complete, so an interrupted write can be resumed
+    and the destination is never left truncated.
     """
 
     file_format = attr.ib(default="csv", type="str", kw_only=True)
@@ -36,3 +43,46 @@ class FileWriter(BaseWriter):
     def write(self, data: Any) -> None:
         with open(self.destination, "wb") as f:
             f.write(data)
+
+    @property
+    def partial_destination(self) -> str:
+        return f"{self.destination}.part"
+
+    @property
+    def partial_size(self) -> int:
+        """
+        Bytes already written to the partial file of an interrupted stream
+        """
+        if os.path.exists(self.partial_destination):
+            return os.path.getsize(self.partial_destination)
+        return 0
+
+    def discard_partial(self) -> None:
+        if os.path.exists(self.partial_destination):
+            os.remove(self.partial_destination)
+
+    def write_stream(
+        self, chunks: Iterable[bytes], expected_size: Optional[int] = None
+    ) -> None:
+        """
+        Append chunks to the partial file and move it to the destination
+        Args:
+            chunks: data, in order, following what is already in the partial file
+            expected_size: final size of the file, if known. If the partial
+                file does not reach it, it is kept to be resumed and
+                IncompleteDownload is raised.
+        """
+        with open(self.partial_destination, "ab") as f:
+            for chunk in chunks:
+                f.write(chunk)
+
+        if expected_size is not None and self.partial_size != expected_size:
+            size = self.partial_size
+            if size > expected_size:
+                # Can not be resumed, start again on the next attempt
+                self.discard_partial()
+            raise IncompleteDownload(
+                f"{size} of {expected_size} bytes written to {self.partial_destination}"
+            )
+
+        os.replace(self.partial_destination, self.destination)
@@ -0,0 +1,91 @@
+import math
+from typing import Any, List, Sequence
+
+import attr
+import numpy as np
+import rasterio
+
+from empatia.settings.constants import MERRA_LEVEL, MERRA_SHORTNAME
+
+
+@attr.s
+class MerraCube:
+    """
+    Variables of a MERRA NetCDF file read at once, as a
+    (time, variable, lat, lon) array
+    """
+
+    variables = attr.ib(type=List[str])
+    data = attr.ib(type=np.ndarray)
+    transform = attr.ib(type=Any)
+
+    @classmethod
+    def read(cls, merra_file: str, variables: Sequence[str]) -> "MerraCube":
+        """
+        Read the variables of a MERRA file. Variables given by level, as
+        (time, lev, lat, lon), are read at MERRA_LEVEL.
+        Args:
+            merra_file: NetCDF file
+            variables: variables to read
+        Returns:
+            Cube with NaN as null value
+        """
+        bands = []
+        for var in variables:
+            with rasterio.open(f"NETCDF:{merra_file}:{var}") as src:
+                indexes = get_level_indexes(src, MERRA_LEVEL)
+                if not indexes:
+                    raise ValueError(
+                        f"{var} of {merra_file} has no level {MERRA_LEVEL}"
+                    )
+                data = src.read(indexes, masked=True)
+                bands.append(data.astype(np.float64).filled(np.nan))
+                transform = src.transform
+
+        return cls(list(variables), np.stack(bands, axis=1), transform)
+
+    @property
+    def times(self) -> int:
+        return int(self.data.shape[0])
+
+    def slice_bands(self, bands: List[int]) -> np.ndarray:
+        """
+        Get the variables of the given bands
+        Args:
+            bands: data indexes, starting at 1
+        Returns:
+            (band, variable, lat, lon) array
+        """
+        return self.data[[band - 1 for band in bands]]
+
+
+def get_level_indexes(src: Any, level: float) -> List[int]:
+    """
+    Get the bands of a NetCDF variable at a level. GDAL reads a
+    (time, lev, lat, lon) variable as a band for every time and level.
+    Args:
+        src: open NetCDF variable
+        level: model level
+    Returns:
+        Band indexes, one per time. Every band if the variable has no levels.
+    """
+    return [
+        index
+        for index in src.indexes
+        if float(src.tags(index).get("NETCDF_DIM_lev", level)) == level
+    ]
+
+
+def get_merra_band(shortname: str, hour: int) -> int:
+    """
+    Get the data index of a MERRA product for a given hour.
+    Products are hourly from 12:30, except M2I3NVASM that is 3-hourly from 12:00.
+    Args:
+        shortname: MERRA product shortname
+        hour: orbit hour
+    Returns:
+        Data index, starting at 1
+    """
+    if shortname == MERRA_SHORTNAME:
+        return (math.trunc(hour / 3) + 1) - 4
+    return (hour % 12) + 1
@@ -1,5 +1,6 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime as dt
-from typing import List
+from typing import Dict, List
 
 from empatia.etl.downloader import get_data
 from empatia.settings import MERRA_DATASET_PATH
@@ -48,3 +49,19 @@ def get_merra_files(
 
     logger.info(f"Downloading MERRA2 product: {product}")
     get_data(base_url, f"{dst_path}{product}", file_format, params=params)
+
+
+def get_all_merra_files(date_stamp: str, datasets: List[Dict]) -> None:
+    """
+    Download the MERRA products of a date concurrently
+    Args:
+        date_stamp: date to download (YYYY-MM-DD)
+        datasets: parameters of each MERRA product
+    """
+    with ThreadPoolExecutor(max_workers=len(datasets)) as executor:
+        futures = [
+            executor.submit(get_merra_files, date_stamp, **dataset)
+            for dataset in datasets
+        ]
+        for future in futures:
+            future.result()
@@ -1,12 +1,29 @@
-from typing import Dict, List, Tuple
+import datetime as dt
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
 
 import modapsclient
 
+from empatia.etl.catalog_cache import CatalogCache
 from empatia.etl.downloader import get_data
-from empatia.settings import MODIS_DATASET_PATH
+from empatia.etl.tile_index import count_skipped, is_outside
+from empatia.settings import LAADS_CATALOG_CACHE_PATH, MODIS_DATASET_PATH
+from empatia.settings.constants import (
+    DEFAULT_DATE_FORMAT,
+    LAADS_CATALOG_TTL,
+    LAADS_METADATA_BATCH_SIZE,
+    LAADS_RECENT_SEARCH_TTL,
+    LAADS_SEARCH_SETTLE_DAYS,
+    MODIS_DOWNLOAD_WORKERS,
+)
 from empatia.settings.credentials import NASA_TOKEN
 from empatia.settings.log import logger
 
+_catalog = CatalogCache(str(LAADS_CATALOG_CACHE_PATH))
+
 
 def get_modis_urls(
     product: str,
@@ -17,27 +34,47 @@ def get_modis_urls(
     west: float,
     start_date: str,
     end_date: str = None,
-) -> Tuple[List, List]:
+) -> Tuple[List, List, List]:
     """
-    Get uls of Modis products
+    Get uls of Modis products, with their names and sizes in bytes.
+    Catalog lookups and file searches are cached, so only new searches query
+    LAADS, with the metadata of the files found resolved in batches.
     """
 
     urls: List[str] = []
-    fnames: List[Dict] = []
-    mclient = modapsclient.ModapsClient()
+    fnames: List[str] = []
+    sizes: List[int] = []
 
     if not end_date:
         end_date = start_date
 
+    search_key = (
+        f"search/{product}/{collection}/{start_date}/{end_date}/"
+        f"{north},{south},{east},{west}"
+    )
+    found = _catalog.get(search_key)
+    if found is not None:
+        logger.info(f"Files of {product} for {start_date}-{end_date} found in cache")
+        # Sizes are unknown for searches cached before they were recorded
+        return found["fnames"], found["urls"], found.get("sizes", [])
+
+    mclient = modapsclient.ModapsClient()
+
     try:
         # check product
-        prods = mclient.listProducts()
-        if not (product in prods.keys()):
+        prods = _catalog.get("products")
+        if prods is None:
+            prods = list(mclient.listProducts().keys())
+            _catalog.set("products", prods, LAADS_CATALOG_TTL)
+        if not (product in prods):
             raise ValueError("Invalid product")
 
         # check collection
-        colls = mclient.getCollections(product)
-        if not str(collection) in colls.keys():
+        colls = _catalog.get(f"collections/{product}")
+        if colls is None:
+            colls = list(mclient.getCollections(product).keys())
+            _catalog.set(f"collections/{product}", colls, LAADS_CATALOG_TTL)
+        if not str(collection) in colls:
             raise ValueError(f"Invalid collection param for {product}")
 
         files = mclient.searchForFiles(
@@ -54,16 +91,66 @@ def get_modis_urls(
         if len(files) == 1:
             raise ValueError(f"Data not found for range: {start_date}-{end_date}")
 
-        for fn in files:
-            metadata = mclient.getFileProperties(fn)
-            fnames.extend([meta["fileName"] for meta in metadata])
-            urls.extend(mclient.getFileUrls(fn))
+        fnames, urls, sizes = resolve_files(mclient, files)
 
     except ValueError:
         logger.error(f"Invalid request to get files for {product}")
-        return fnames, urls
+        return fnames, urls, sizes
+
+    _catalog.set(
+        search_key,
+        {"fnames": fnames, "urls": urls, "sizes": sizes},
+        get_search_ttl(end_date),
+    )
+    return fnames, urls, sizes
 
-    return fnames, urls
+
+def resolve_files(
+    mclient: modapsclient.ModapsClient, files: List
+) -> Tuple[List[str], List[str], List[int]]:
+    """
+    Get names, urls and sizes of files, LAADS_METADATA_BATCH_SIZE files per request.
+    LAADS does not guarantee the order of the results, so metadata is matched
+    to files by ID and urls by file name.
+    Args:
+        mclient: LAADS client
+        files: file IDs
+    Return:
+        File names, urls and sizes, in the order of the file IDs
+    """
+    fnames: List[str] = []
+    urls: List[str] = []
+    sizes: List[int] = []
+    for i in range(0, len(files), LAADS_METADATA_BATCH_SIZE):
+        file_ids = [str(fn) for fn in files[i : i + LAADS_METADATA_BATCH_SIZE]]
+        batch = ",".join(file_ids)
+        metadata = {
+            str(meta["fileId"]): meta for meta in mclient.getFileProperties(batch)
+        }
+        batch_urls = {
+            os.path.basename(urlparse(url).path): url
+            for url in mclient.getFileUrls(batch)
+        }
+        for file_id in file_ids:
+            meta = metadata.get(file_id)
+            if meta is None or meta["fileName"] not in batch_urls:
+                raise ValueError(f"Incomplete metadata for file {file_id}")
+            fnames.append(meta["fileName"])
+            sizes.append(int(meta.get("fileSizeBytes", 0)))
+            urls.append(batch_urls[meta["fileName"]])
+
+    return fnames, urls, sizes
+
+
+def get_search_ttl(end_date: str) -> Optional[float]:
+    """
+    Get how long the files found for a date range are valid. New files of
+    recent dates can still be published.
+    """
+    settled = dt.datetime.now() - dt.timedelta(days=LAADS_SEARCH_SETTLE_DAYS)
+    if dt.datetime.strptime(end_date, DEFAULT_DATE_FORMAT) < settled:
+        return None
+    return LAADS_RECENT_SEARCH_TTL
 
 
 def get_modis_files(
@@ -75,9 +162,13 @@ def get_modis_files(
     west: float,
     start_date: str,
     end_date: str = None,
+    tile_index: Optional[Dict[str, str]] = None,
 ) -> bool:
     """
-    Download Modis products
+    Download Modis products, up to MODIS_DOWNLOAD_WORKERS files at once.
+    Every file is retried and resumed by `get_data`, and the first error is
+    raised once all downloads have finished.
+    If a tile index is given, granules of tiles outside the region are skipped.
     Return True if there are files to be processed
            False otherwise
     """
@@ -86,16 +177,51 @@ def get_modis_files(
 
     dst_path = f"{MODIS_DATASET_PATH}/{product}/{start_date}/"
     logger.info(f"Get MODIS urls to download files for: {product}")
-    fnames, urls = get_modis_urls(
+    fnames, urls, sizes = get_modis_urls(
         product, collection, north, south, east, west, start_date, end_date
     )
+    skipped_size = 0
+    if tile_index is not None:
+        outside = [is_outside(tile_index, fn) for fn in fnames]
+        skipped_size = sum(size for size, out in zip(sizes, outside) if out)
+        fnames = [fn for fn, out in zip(fnames, outside) if not out]
+        urls = [url for url, out in zip(urls, outside) if not out]
+        sizes = [size for size, out in zip(sizes, outside) if not out]
+        count_skipped(granules=sum(outside), size=skipped_size)
+        logger.info(
+            f"{sum(outside)} {product} granules outside the region skipped "
+            f"({skipped_size / 2 ** 20:.1f} MB)"
+        )
     if not fnames:
         logger.info(f"NO files found out for the dates: {start_date}-{end_date}")
         return False
     logger.info(f"Downloading MODIS's files for: {product}")
-    for fn, url in zip(fnames, urls):
-        fn_splitted = fn.split(".")
-        fn = ".".join(fn_splitted[:-1])
-        file_format = fn_splitted[-1]
-        get_data(url, f"{dst_path}{fn}", file_format, headers=headers)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=MODIS_DOWNLOAD_WORKERS) as executor:
+        futures = []
+        # Sizes are 0 if LAADS does not report them
+        for fn, url, size in zip(fnames, urls, sizes or [0] * len(urls)):
+            fn_splitted = fn.split(".")
+            fn = ".".join(fn_splitted[:-1])
+            file_format = fn_splitted[-1]
+            futures.append(
+                executor.submit(
+                    get_data,
+                    url,
+                    f"{dst_path}{fn}",
+                    file_format,
+                    headers=headers,
+                    size=size or None,
+                )
+            )
+        downloaded = sum(future.result() for future in futures)
+
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"{len(futures)} {product} files ({downloaded / 2 ** 20:.1f} MB downloaded) "
+        f"in {elapsed:.2f}s, {downloaded / 2 ** 20 / max(elapsed, 1e-6):.1f} MB/s"
+    )
+    if downloaded:
+        # Seconds saved are estimated from the throughput of this download
+        count_skipped(download_seconds=skipped_size * elapsed / downloaded)
     return True
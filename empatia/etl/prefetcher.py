@@ -0,0 +1,38 @@
+import itertools
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Deque, Iterator, List, Optional, Tuple
+
+from empatia.settings.log import logger
+
+
+def prefetch(
+    items: List[str], fetch: Callable[[str], bool], ahead: int
+) -> Iterator[Tuple[str, Optional[bool]]]:
+    """
+    Fetch items in a background thread while the caller consumes them
+    Args:
+        items: items to fetch, in order
+        fetch: function that downloads the inputs of an item
+        ahead: number of items to keep fetching beyond the one being consumed
+    Yields:
+        Item and the result of `fetch` (None if fetching failed)
+    """
+    pending: Deque[Tuple[str, Future]] = deque()
+    items_iter = iter(items)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        for item in itertools.islice(items_iter, ahead + 1):
+            pending.append((item, executor.submit(fetch, item)))
+
+        while pending:
+            item, future = pending.popleft()
+            result: Optional[bool] = None
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"Inputs for {item} were not prefetched: {e}")
+
+            for next_item in itertools.islice(items_iter, 1):
+                pending.append((next_item, executor.submit(fetch, next_item)))
+
+            yield item, result
@@ -0,0 +1,230 @@
+import json
+import os
+import re
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+import numpy as np
+from rasterio.transform import array_bounds
+from rasterio.warp import transform, transform_bounds
+
+from empatia.settings.log import logger
+from empatia.utils.domain import get_domain_profile, rasterize_region
+from empatia.utils.files import atomic_write, file_lock
+from empatia.utils.mask import region_fingerprint
+
+INSIDE = "inside"
+PARTIAL = "partial"
+OUTSIDE = "outside"
+
+# MODIS sinusoidal tile grid
+SINUSOIDAL_CRS = "+proj=sinu +lon_0=0 +x_0=0 +y_0=0 +R=6371007.181 +units=m +no_defs"
+SINUSOIDAL_TILE_SIZE = 1111950.5197665
+SINUSOIDAL_WEST = -20015109.354
+SINUSOIDAL_NORTH = 10007554.677
+TILE_PATTERN = re.compile(r"\.(h\d{2}v\d{2})\.")
+
+INDEX_BLOCK_ROWS = 256
+
+_report: Counter = Counter()
+_report_lock = threading.Lock()
+
+
+def get_tile_index(
+    region_path: Union[str, Path],
+    domain_path: Union[str, Path],
+    cache_path: Union[str, Path],
+) -> Dict[str, str]:
+    """
+    Classify the sinusoidal tiles as inside, partially inside or outside the
+    region. The index is built once and cached until the region or the domain
+    change. The region is rasterized only to build it, since the raster
+    engines cache their own masks.
+    Args:
+        region_path: vector dir path
+        domain_path: raster file that defines the domain
+        cache_path: tile index cache file
+    Returns:
+        Class of each tile that covers the domain, by tile name (h12v12)
+    """
+    profile = get_domain_profile(domain_path)
+    index_fingerprint = region_fingerprint(
+        region_path, profile["transform"], profile["width"], profile["height"]
+    )
+    tiles = load_tile_index(cache_path, index_fingerprint)
+    if tiles is not None:
+        return tiles
+
+    # Workers wait for the first one to build the index
+    with file_lock(cache_path):
+        tiles = load_tile_index(cache_path, index_fingerprint)
+        if tiles is not None:
+            return tiles
+
+        logger.info("Rasterizing region mask...")
+        cells = rasterize_region(region_path, profile)
+        logger.info("Building tile index...")
+        tiles = build_tile_index(profile, cells)
+        with atomic_write(cache_path) as tmp_path:
+            with open(tmp_path, "w") as outfile:
+                json.dump(
+                    {"fingerprint": index_fingerprint, "tiles": tiles},
+                    outfile,
+                    indent=4,
+                )
+
+    classes = Counter(tiles.values())
+    logger.info(
+        f"Tile index: {classes[INSIDE]} tiles inside, {classes[PARTIAL]} partially "
+        f"inside and {classes[OUTSIDE]} outside the region"
+    )
+    return tiles
+
+
+def load_tile_index(
+    cache_path: Union[str, Path], index_fingerprint: str
+) -> Optional[Dict[str, str]]:
+    """
+    Load the tile index from its cache, None if the cache does not exist or is
+    stale
+    """
+    if not os.path.exists(cache_path):
+        return None
+
+    with open(cache_path) as json_file:
+        cached = json.load(json_file)
+    if cached["fingerprint"] != index_fingerprint:
+        return None
+    tiles: Dict[str, str] = cached["tiles"]
+    return tiles
+
+
+def build_tile_index(profile: Dict[str, Any], mask: np.ndarray) -> Dict[str, str]:
+    """
+    Classify the sinusoidal tiles by the domain cells they cover
+    Args:
+        profile: domain grid
+        mask: boolean array, True for cells inside the region
+    Returns:
+        Class of each tile that covers the domain, by tile name
+    """
+    height, width = mask.shape
+    domain_transform = profile["transform"]
+    cells: Counter = Counter()
+    region_cells: Counter = Counter()
+    xs = domain_transform.c + domain_transform.a * (np.arange(width) + 0.5)
+    for row in range(0, height, INDEX_BLOCK_ROWS):
+        rows = np.arange(row, min(row + INDEX_BLOCK_ROWS, height))
+        ys = domain_transform.f + domain_transform.e * (rows + 0.5)
+        block_xs, block_ys = np.meshgrid(xs, ys)
+        sin_xs, sin_ys = transform(
+            profile["crs"], SINUSOIDAL_CRS, block_xs.ravel(), block_ys.ravel()
+        )
+        htiles = np.floor((np.asarray(sin_xs) - SINUSOIDAL_WEST) / SINUSOIDAL_TILE_SIZE)
+        vtiles = np.floor(
+            (SINUSOIDAL_NORTH - np.asarray(sin_ys)) / SINUSOIDAL_TILE_SIZE
+        )
+        codes = (htiles * 100 + vtiles).astype(int)
+        cells.update(dict(zip(*np.unique(codes, return_counts=True))))
+        region_cells.update(
+            dict(zip(*np.unique(codes[mask[rows].ravel()], return_counts=True)))
+        )
+
+    west, south, east, north = array_bounds(height, width, domain_transform)
+    tiles = {}
+    for code in cells:
+        htile, vtile = divmod(int(code), 100)
+        if not region_cells[code]:
+            tiles[f"h{htile:02d}v{vtile:02d}"] = OUTSIDE
+            continue
+
+        # A tile is only inside if all of it is in the domain, and so in the mask
+        tile_west = SINUSOIDAL_WEST + htile * SINUSOIDAL_TILE_SIZE
+        tile_north = SINUSOIDAL_NORTH - vtile * SINUSOIDAL_TILE_SIZE
+        tile_bounds = transform_bounds(
+            SINUSOIDAL_CRS,
+            profile["crs"],
+            tile_west,
+            tile_north - SINUSOIDAL_TILE_SIZE,
+            tile_west + SINUSOIDAL_TILE_SIZE,
+            tile_north,
+        )
+        in_domain = (
+            tile_bounds[0] >= west
+            and tile_bounds[1] >= south
+            and tile_bounds[2] <= east
+            and tile_bounds[3] <= north
+        )
+        if in_domain and region_cells[code] == cells[code]:
+            tiles[f"h{htile:02d}v{vtile:02d}"] = INSIDE
+        else:
+            tiles[f"h{htile:02d}v{vtile:02d}"] = PARTIAL
+
+    return tiles
+
+
+def get_granule_tile(fname: str) -> Optional[str]:
+    """
+    Get the sinusoidal tile of a MODIS granule from its file name
+    (MCD19A2.A2021001.h12v12.006.2021003040838.hdf)
+    """
+    match = TILE_PATTERN.search(fname)
+    return match.group(1) if match else None
+
+
+def is_outside(tile_index: Dict[str, str], fname: str) -> bool:
+    """
+    Check if a granule does not intersect the region. Granules whose tile is
+    unknown are kept.
+    """
+    tile = get_granule_tile(fname)
+    return tile is not None and tile_index.get(tile, OUTSIDE) == OUTSIDE
+
+
+def count_skipped(
+    granules: int = 0,
+    size: int = 0,
+    download_seconds: float = 0.0,
+    decode_seconds: float = 0.0,
+) -> None:
+    with _report_lock:
+        _report.update(
+            {
+                "granules": granules,
+                "size": size,
+                "download_seconds": download_seconds,
+                "decode_seconds": decode_seconds,
+            }
+        )
+
+
+def pop_skip_counts() -> Counter:
+    """
+    Get the skipped granules since the last call, to merge them into the
+    report of another process
+    """
+    with _report_lock:
+        counts = _report.copy()
+        _report.clear()
+    return counts
+
+
+def add_skip_counts(counts: Counter) -> None:
+    with _report_lock:
+        _report.update(counts)
+
+
+def pop_skip_report() -> str:
+    """
+    Get the granules skipped outside the region since the last call, with the
+    bytes and the estimated seconds saved
+    """
+    counts = pop_skip_counts()
+    return (
+        f"{counts['granules']} granules skipped, "
+        f"{counts['size'] / 2 ** 20:.1f} MB and "
+        f"{counts['download_seconds']:.1f}s of downloads and "
+        f"{counts['decode_seconds']:.1f}s of decoding saved"
+    )
@@ -1,15 +1,30 @@
 import glob
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
 from datetime import datetime as dt
+from functools import partial
 from operator import itemgetter
-from typing import Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
+import attr
 import gdal
 import numpy as np
 import rasterio
-from rasterio.merge import merge
-from rasterio.warp import Resampling, calculate_default_transform, reproject
+from rasterio.crs import CRS
+from rasterio.errors import WindowError
+from rasterio.transform import Affine, array_bounds
+from rasterio.warp import transform_bounds
+from rasterio.windows import Window, from_bounds
+from rasterio.windows import transform as window_transform
 
-from empatia.settings.constants import CELL_NULL_VALUE
+from empatia.etl.tile_index import count_skipped, is_outside
+from empatia.settings.constants import CELL_NULL_VALUE, HDF_DECODE_WORKERS
+from empatia.settings.log import logger
+from empatia.utils.domain import RegionGrid, write_domain_gtiff
+from empatia.utils.regrid import BilinearRegridder
+
+MOSAIC_BLOCK_ROWS = 512
 
 
 def extract_modis_date(modis_date: str) -> Tuple[dt, str]:
@@ -34,35 +49,6 @@ def extract_modis_date(modis_date: str) -> Tuple[dt, str]:
     return date_obj, sensor
 
 
-def reproject_tiff(infile: str, outfile: str, dst_crs: str = "EPSG:4326") -> None:
-    """
-    Reproject raster map
-    Args:
-        infile: TIFF file
-        outfile: TIFF file
-        dst_crs: georeference system
-    """
-    with rasterio.open(infile) as src:
-        transform, width, height = calculate_default_transform(
-            src.crs, dst_crs, src.width, src.height, *src.bounds
-        )
-        kwargs = src.meta.copy()
-        kwargs.update(
-            {"crs": dst_crs, "transform": transform, "width": width, "height": height}
-        )
-        with rasterio.open(outfile, "w", **kwargs) as dst:
-            for i in range(1, src.count + 1):
-                reproject(
-                    source=rasterio.band(src, i),
-                    destination=rasterio.band(dst, i),
-                    src_transform=src.transform,
-                    src_crs=src.crs,
-                    dst_transform=transform,
-                    dst_crs=dst_crs,
-                    resampling=Resampling.bilinear,
-                )
-
-
 def tag_modis_orbits(orbits: List, sensor: str) -> List:
     """
     Tag tiles
@@ -113,55 +99,135 @@ def groupby_sensor_by_orbit(orbits: List) -> Dict[str, List]:
     return res
 
 
-def create_mosaic(tfiles: List, output_name: str) -> None:
+def create_mosaic(tfiles: List, output_name: str) -> Dict[str, Any]:
     """
-    Get mosaic from list of tiles
+    Mosaic a list of tiles by blocks of rows, so only a block of the mosaic
+    is in memory at a time. Where tiles overlap, the first valid value is kept.
     Args:
         tfiles: list of tiles
         output_name: mosaic name
+    Return:
+        Mosaic metadata
+    """
+    with ExitStack() as stack:
+        sources = [stack.enter_context(rasterio.open(tfile)) for tfile in tfiles]
+        first = sources[0]
+        res_x, res_y = first.res
+        west = min(src.bounds.left for src in sources)
+        south = min(src.bounds.bottom for src in sources)
+        east = max(src.bounds.right for src in sources)
+        north = max(src.bounds.top for src in sources)
+        width = int(round((east - west) / res_x))
+        height = int(round((north - south) / res_y))
+        out_trans = Affine.translation(west, north) * Affine.scale(res_x, -res_y)
+        out_meta = first.meta.copy()
+        out_meta.update(
+            {
+                "driver": "GTiff",
+                "height": height,
+                "width": width,
+                "transform": out_trans,
+            }
+        )
+
+        # Window of each tile in the mosaic
+        windows = []
+        for src in sources:
+            window = from_bounds(*src.bounds, transform=out_trans)
+            windows.append(Window(*(int(round(v)) for v in window.flatten())))
+
+        nodata = first.nodata if first.nodata is not None else 0
+        with rasterio.open(output_name, "w", **out_meta) as f:
+            for row in range(0, height, MOSAIC_BLOCK_ROWS):
+                rows = min(MOSAIC_BLOCK_ROWS, height - row)
+                block = np.full((first.count, rows, width), nodata, first.dtypes[0])
+                filled = np.zeros(block.shape, dtype=bool)
+                for src, window in zip(sources, windows):
+                    top = max(row, window.row_off)
+                    bottom = min(row + rows, window.row_off + window.height)
+                    if top >= bottom:
+                        continue
+
+                    scale = src.height / window.height
+                    data = src.read(
+                        window=Window(
+                            0,
+                            (top - window.row_off) * scale,
+                            src.width,
+                            (bottom - top) * scale,
+                        ),
+                        out_shape=(first.count, bottom - top, window.width),
+                        masked=True,
+                    )
+                    cells = (
+                        slice(None),
+                        slice(top - row, bottom - row),
+                        slice(window.col_off, window.col_off + window.width),
+                    )
+                    new = ~np.ma.getmaskarray(data) & ~filled[cells]
+                    block[cells][new] = data.data[new]
+                    filled[cells] |= new
+                f.write(block, window=Window(0, row, width, rows))
+
+    return out_meta
+
+
+@attr.s
+class ModisTile:
+    """
+    Orbits of MODIS HDF tile subdatasets, decoded in memory as an
+    (orbit, subdataset, row, column) array in the sinusoidal projection of
+    the tile
     """
-    tiles_for_mosaic = []
-    for tfile in tfiles:
-        src = rasterio.open(tfile)
-        tiles_for_mosaic.append(src)
-
-    mosaic, out_trans = merge(tiles_for_mosaic)
-
-    # write mosaic
-    out_meta = src.meta.copy()
-    out_meta.update(
-        {
-            "driver": "GTiff",
-            "height": mosaic.shape[1],
-            "width": mosaic.shape[2],
-            "transform": out_trans,
-        }
-    )
 
-    with rasterio.open(output_name, "w", **out_meta) as f:
-        f.write(mosaic)
+    name = attr.ib(type=str)
+    orbits = attr.ib(type=List[Tuple[dt, str]])
+    data = attr.ib(type=np.ndarray)
+    transform = attr.ib(type=Affine)
+    crs = attr.ib(type=CRS)
+    nodata = attr.ib(type=int)
+
+    @property
+    def bounds(self) -> Tuple[float, float, float, float]:
+        west, south, east, north = array_bounds(
+            self.data.shape[2], self.data.shape[3], self.transform
+        )
+        return west, south, east, north
 
+    def orbit_index(self, date: dt, sensor: str) -> int:
+        return self.orbits.index((date, sensor))
 
-def modis_hdf_2_tiff(
-    infile: str,
-    subset: int,
-    prefix_outfile: str,
-    outdir: str = "",
-    non_value: int = -32768,
-) -> List:
+
+def read_modis_tile(
+    infile: str, subsets: List[int], non_value: int = -32768
+) -> ModisTile:
     """
-    Get Modis layers from HDF file
+    Get Modis layers from HDF file. The file is opened once and all the
+    subsets are read from it.
     Args:
         infile: HDF file
-        subset: product index
-        prefix_outfile: prefix for output file
-        outdir: ouput directory
+        subsets: product indexes
         non_value: int to fill missing values
     Return:
-        List of orbits for the given subset
+        Orbits of the given subsets
     """
     hdf_ds = gdal.Open(infile, gdal.GA_ReadOnly)
-    band_ds = gdal.Open(hdf_ds.GetSubDatasets()[subset][0], gdal.GA_ReadOnly)
+    subdatasets = hdf_ds.GetSubDatasets()
+    band_arrays = []
+    for subset in subsets:
+        band_ds = gdal.Open(subdatasets[subset][0], gdal.GA_ReadOnly)
+        # read into numpy array
+        band_array = band_ds.ReadAsArray().astype(np.int16)
+        if band_array.ndim == 2:
+            band_array = band_array[np.newaxis]
+        band_arrays.append(band_array)
+    band_array = np.stack(band_arrays, axis=1)
+
+    # convert no_data values
+    band_array[band_array == CELL_NULL_VALUE] = non_value
+
+    # Subsets of a tile share orbits and geometry
+    band_ds = gdal.Open(subdatasets[subsets[0]][0], gdal.GA_ReadOnly)
 
     # read metadata
     metadata = band_ds.GetMetadata_Dict()
@@ -169,75 +235,187 @@ def modis_hdf_2_tiff(
     orbits = list(filter(lambda x: x != "", orbits))
     htile = metadata.get("HORIZONTALTILENUMBER", "")
     vtile = metadata.get("VERTICALTILENUMBER", "")
-    tile = f"h{htile}_v{vtile}"
 
-    # read into numpy array
-    band_array = band_ds.ReadAsArray().astype(np.int16)
+    return ModisTile(
+        f"h{htile}_v{vtile}",
+        [extract_modis_date(orbit) for orbit in orbits],
+        band_array,
+        Affine.from_gdal(*band_ds.GetGeoTransform()),
+        CRS.from_wkt(band_ds.GetProjection()),
+        non_value,
+    )
+
+
+def decode_modis_tiles(rfiles: List[str], subsets: List[int]) -> List[ModisTile]:
+    """
+    Decode HDF tiles, up to HDF_DECODE_WORKERS at once in separate processes
+    Args:
+        rfiles: HDF files
+        subsets: product indexes
+    Return:
+        Tiles in the order of the files, whatever order they are decoded in
+    """
+    decode = partial(read_modis_tile, subsets=subsets)
+    workers = min(HDF_DECODE_WORKERS, len(rfiles))
+    if workers <= 1:
+        return [decode(rfile) for rfile in rfiles]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(decode, rfiles))
+
+
+def get_tile_window(tile: ModisTile, profile: Dict[str, Any]) -> Optional[Window]:
+    """
+    Get the window of the domain grid covered by a tile
+    Args:
+        tile: decoded tile
+        profile: domain grid
+    Return:
+        Window, None if the tile is outside the domain
+    """
+    bounds = transform_bounds(tile.crs, profile["crs"], *tile.bounds)
+    try:
+        return (
+            from_bounds(*bounds, transform=profile["transform"])
+            .round_offsets(op="floor")
+            .round_lengths(op="ceil")
+            .intersection(Window(0, 0, profile["width"], profile["height"]))
+        )
+    except WindowError:
+        return None
 
-    # convert no_data values
-    band_array[band_array == CELL_NULL_VALUE] = non_value
 
-    # write raster
-    bands = []
-    for e, orbit in enumerate(orbits):
-        date, sensor = extract_modis_date(orbit)
-        orbit_outfile = f"{outdir}{prefix_outfile}_{date.hour}_{sensor}_{tile}.tif"
-        out_ds = gdal.GetDriverByName("GTiff").Create(
-            orbit_outfile,
-            band_ds.RasterXSize,
-            band_ds.RasterYSize,
-            1,  # Number of bands
-            gdal.GDT_Int16,
-            ["COMPRESS=LZW", "TILED=YES"],
+def domain_mosaic(
+    orbit_tiles: List[Tuple[ModisTile, int]], region: RegionGrid, plan_dir: str
+) -> np.ndarray:
+    """
+    Interpolate an orbit of several tiles straight onto the domain grid. The
+    warp plan of each tile, from its cells to the domain cells it covers, is
+    computed once and cached. All the subdatasets are interpolated at once.
+    Where tiles overlap, the first valid value is kept.
+    Args:
+        orbit_tiles: tiles and the index of the orbit in each of them
+        region: domain grid and region mask
+        plan_dir: directory of cached warp plans
+    Return:
+        (subdataset, row, column) mosaic array, with NaN as null value and
+        outside the region
+    """
+    profile = region.profile
+    count = orbit_tiles[0][0].data.shape[1]
+    mosaic = np.full((count, profile["height"], profile["width"]), np.nan)
+    for tile, orbit in orbit_tiles:
+        window = get_tile_window(tile, profile)
+        if window is None:
+            continue
+
+        plan = BilinearRegridder.load(
+            plan_dir,
+            tile.transform,
+            tile.data.shape[2:],
+            window_transform(window, profile["transform"]),
+            (int(window.height), int(window.width)),
+            tile.crs,
+            profile["crs"],
+            skip_nulls=True,
         )
-        out_ds.SetGeoTransform(band_ds.GetGeoTransform())
-        out_ds.SetProjection(band_ds.GetProjection())
-        out_ds.GetRasterBand(1).WriteArray(band_array[e])
-        out_ds.GetRasterBand(1).SetNoDataValue(non_value)
+        data = tile.data[orbit].astype(np.float64)
+        data[data == tile.nodata] = np.nan
+        # Values stay integers, as in the HDF
+        warped = np.rint(plan.regrid(data))
 
-        out_ds = None  # close dataset to write to disc
-        reproject_tiff(orbit_outfile, orbit_outfile)
-        bands.append((date, sensor, tile))
+        covered = mosaic[(slice(None),) + window.toslices()]
+        empty = np.isnan(covered)
+        covered[empty] = warped[empty]
 
-    return bands
+    mosaic[:, ~region.mask] = np.nan
+    return mosaic
 
 
-def get_modis_mosaic(indir: str, band: int, prefix: str, outdir: str = "") -> List:
+def get_modis_mosaics(
+    indir: str,
+    bands: Dict[int, str],
+    region: RegionGrid,
+    plan_dir: str,
+    outdir: str = "",
+    tile_index: Optional[Dict[str, str]] = None,
+) -> List:
     """
-    Create mosaics for each orbit of a given band
+    Create mosaics on the domain grid for each orbit of the given bands.
+    Tiles are decoded once, with all the bands, and interpolated onto the
+    domain in memory, so only the mosaics are written.
     Args:
         indir: directory of HDF tiles
-        band: product index
-        prefix: prefix of the output file
+        bands: prefix of the output file by product index
+        region: domain grid and region mask
+        plan_dir: directory of cached warp plans
         outdir: directory of the output file
+        tile_index: if given, tiles outside the region are not decoded
     Return
-        List of generated mosaic metadata
+        List of generated mosaic metadata, with the file and the number of
+        valid cells of each band
     """
     if outdir == "":
         outdir = indir
 
+    start = time.perf_counter()
     rfiles = sorted(glob.glob(f"{indir}*.hdf"))
-    bands = []
-    for rfile in rfiles:
-        bands.extend(modis_hdf_2_tiff(rfile, band, prefix, indir))
-
-    orbit_groups = groupby_sensor_by_orbit(bands)
+    skipped = 0
+    if tile_index is not None:
+        rfiles_in_region = [f for f in rfiles if not is_outside(tile_index, f)]
+        skipped = len(rfiles) - len(rfiles_in_region)
+        rfiles = rfiles_in_region
+    tiles: Dict[str, ModisTile] = {}
+    orbits: List[Tuple[dt, str, str]] = []
+    for tile in decode_modis_tiles(rfiles, list(bands)):
+        tiles[tile.name] = tile
+        orbits.extend((date, sensor, tile.name) for date, sensor in tile.orbits)
+    decoded = time.perf_counter()
+    if skipped and rfiles:
+        # Seconds saved are estimated from the decoding time of the other tiles
+        count_skipped(decode_seconds=skipped * (decoded - start) / len(rfiles))
+
+    orbit_groups = groupby_sensor_by_orbit(orbits)
 
     # generate mosaics
     mosaic_files = []
 
-    for key, tiles in orbit_groups.items():
-        if len(tiles) > 2:
-            date = tiles[0][0]
-            sensor = tiles[0][1]
+    for key, orbit_tiles in orbit_groups.items():
+        if len(orbit_tiles) > 2:
+            date = orbit_tiles[0][0]
+            sensor = orbit_tiles[0][1]
             if (date.hour >= 12) and (date.hour <= 20):
-                tfiles = sorted(glob.glob(f"{indir}{prefix}_{date.hour}_{sensor}*.tif"))
-                output_name = f"{outdir}{prefix}_{date.hour}_{sensor}.tif"
-                create_mosaic(tfiles, output_name)
+                mosaic = domain_mosaic(
+                    [
+                        (tiles[name], tiles[name].orbit_index(tile_date, tile_sensor))
+                        for tile_date, tile_sensor, name in orbit_tiles
+                    ],
+                    region,
+                    plan_dir,
+                )
+                output_names = {}
+                valid_cells = {}
+                for prefix, band_mosaic in zip(bands.values(), mosaic):
+                    output_names[prefix] = f"{outdir}{prefix}_{date.hour}_{sensor}.tif"
+                    write_domain_gtiff(
+                        band_mosaic, output_names[prefix], region.profile
+                    )
+                    valid_cells[prefix] = int((~np.isnan(band_mosaic)).sum())
                 mosaic_files.append(
-                    {"file": output_name, "sensor": sensor, "date": date}
+                    {
+                        "files": output_names,
+                        "sensor": sensor,
+                        "date": date,
+                        "valid_cells": valid_cells,
+                    }
                 )
 
+    logger.info(
+        f"{len(rfiles)} tiles of {len(bands)} bands decoded ({skipped} outside the "
+        f"region skipped) in "
+        f"{decoded - start:.2f}s, {len(mosaic_files)} mosaics warped in "
+        f"{time.perf_counter() - decoded:.2f}s"
+    )
     return mosaic_files
 
 
@@ -293,28 +471,8 @@ def get_viirs_mosaic(path: str, band: int, outdir: str, outname: str) -> None:
     # translate format
     rfiles = sorted(glob.glob(f"{path}/*.h5"))
     for rfile in rfiles:
-        output_name = f"{rfile}.tif"
         viirs_hdf_2_tiff(rfile, band, path)
 
     # generate mosaic
-    tiles_for_mosaic = []
     tfiles = sorted(glob.glob(f"{path}/*.tif"))
-    for tfile in tfiles:
-        src = rasterio.open(tfile)
-        tiles_for_mosaic.append(src)
-
-    mosaic, out_trans = merge(tiles_for_mosaic)
-
-    # write mosaic
-    out_meta = src.meta.copy()
-    out_meta.update(
-        {
-            "driver": "GTiff",
-            "height": mosaic.shape[1],
-            "width": mosaic.shape[2],
-            "transform": out_trans,
-        }
-    )
-    output_name = f"{outdir}{outname}"
-    with rasterio.open(output_name, "w", **out_meta) as f:
-        f.write(mosaic)
+    create_mosaic(tfiles, f"{outdir}{outname}")
@@ -9,6 +9,13 @@ MODIS_DATASET_PATH = DATASET_PATH / "modis"
 MERRA_DATASET_PATH = DATASET_PATH / "merra"
 PREDICTION_DATA_PATH = DATASET_PATH / "predict"
 PROCESSED_DATA_PATH = DATASET_PATH / "processed"
+CACHE_DATA_PATH = DATASET_PATH / "cache"
+DOWNLOAD_CACHE_PATH = CACHE_DATA_PATH / "downloads.json"
+LAADS_CATALOG_CACHE_PATH = CACHE_DATA_PATH / "laads_catalog.json"
+REGION_MASK_CACHE_PATH = CACHE_DATA_PATH / "region_mask.npz"
+REGRID_CACHE_PATH = CACHE_DATA_PATH / "regrid"
+TILE_INDEX_CACHE_PATH = CACHE_DATA_PATH / "tile_index.json"
+MONTHLY_ACCUMULATORS_PATH = PREDICTION_DATA_PATH / "monthly" / "accumulators"
 MODEL_DATA_PATH = DATASET_PATH / "model"
 MODEL_PATH = MODEL_DATA_PATH / "model_2021-05-13.pkl"  # "pm10_random_forest.pkl"
 TRAINING_DATA_PATH = MODEL_DATA_PATH / "training_dataset.csv"
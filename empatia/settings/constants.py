@@ -60,6 +60,9 @@ ICA_PM10_METADATA_CODES = {
     **{"pm10_product_names": "<!--todos los productos PM10-->"},
 }
 ICA_PATH = "CONAE_MOD_CDA_ARGeoPM10_ICAPM10"
+# Lower (exclusive) limits of the PM10 (micrograms/m3) ranges of each ICA class,
+# taken from US EPA (2018) EPA-454/B-18-007
+ICA_BREAKPOINTS = [0.1, 54, 154, 254, 354, 424]
 
 # ETL's
 DEFAULT_DATE_FORMAT = "%Y-%m-%d"
@@ -80,10 +83,13 @@ XML_VIIRS_NAME = "Promedio de Abril, Mayo y Junio  {} de VNP46A1,"
 
 MERRA_VERSION = "5.12.4"
 MERRA_REGION = ["-55.05", "-73.57", "-21.78", "-53.64"]
-MERRA_BASE_URL = (
-    "https://goldsmr{version}.gesdisc.eosdis.nasa.gov/daac-bin/OTF/HTTP_services.cgi"
+MERRA_BASE_URL = os.environ.get(
+    "MERRA_BASE_URL",
+    "https://goldsmr{version}.gesdisc.eosdis.nasa.gov/daac-bin/OTF/HTTP_services.cgi",
 )
 MERRA_SHORTNAME = "M2I3NVASM"
+# Model level read from the MERRA variables given by level, 72 is the lowest
+MERRA_LEVEL = float(os.environ.get("MERRA_LEVEL", 72))
 
 MERRA_DATASETS = [
     {
@@ -137,7 +143,43 @@ XML_MERRA_PRODUCT_NAMES = [
     "MERRA2_400.inst3_3d_asm_Nv.{}.SUB.nc: (PS, RH, T, U, V)",
 ]
 
+# Checkpoints
+MANIFEST_FILENAME = "manifest.json"
+DATE_KEY = "date"
+MODIS_STAGE = "modis_mosaic"
+MERRA_STAGE = "merra_features"
+PREDICTION_STAGE = "prediction"
+EXPORT_STAGE = "export"
+ICA_STAGE = "ica"
+
 MIN_PERCENTAGE_OF_VALID_DATA = (
     float(os.environ.get("MIN_PERCENTAGE_OF_VALID_DATA", 0.0)) or 8.0
 )
 CELL_NULL_VALUE = -28672
+
+# Downloads
+DOWNLOAD_MAX_CONNECTIONS_PER_HOST = int(
+    os.environ.get("DOWNLOAD_MAX_CONNECTIONS_PER_HOST", 4)
+)
+DOWNLOAD_RETRIES = int(os.environ.get("DOWNLOAD_RETRIES", 5))
+DOWNLOAD_BACKOFF_FACTOR = float(os.environ.get("DOWNLOAD_BACKOFF_FACTOR", 1.0))
+# MODIS files downloaded at once
+MODIS_DOWNLOAD_WORKERS = int(os.environ.get("MODIS_DOWNLOAD_WORKERS", 4))
+# HDF tiles decoded at once, each in its own process
+HDF_DECODE_WORKERS = int(os.environ.get("HDF_DECODE_WORKERS", 4))
+# LAADS catalog cache: products and collections are refreshed every
+# LAADS_CATALOG_TTL seconds. File searches are kept forever once their dates are
+# LAADS_SEARCH_SETTLE_DAYS old, before that only LAADS_RECENT_SEARCH_TTL seconds.
+LAADS_CATALOG_TTL = float(os.environ.get("LAADS_CATALOG_TTL", 7 * 24 * 3600))
+LAADS_RECENT_SEARCH_TTL = float(os.environ.get("LAADS_RECENT_SEARCH_TTL", 3600))
+LAADS_SEARCH_SETTLE_DAYS = int(os.environ.get("LAADS_SEARCH_SETTLE_DAYS", 3))
+# File IDs resolved per metadata request
+LAADS_METADATA_BATCH_SIZE = int(os.environ.get("LAADS_METADATA_BATCH_SIZE", 50))
+# Bytes read at once from a response and written to disk
+DOWNLOAD_CHUNK_SIZE = int(os.environ.get("DOWNLOAD_CHUNK_SIZE", 1024 * 1024))
+
+# Raster engine used by default: "grass" or "memory"
+RASTER_ENGINE = os.environ.get("RASTER_ENGINE", "grass")
+
+# Rows read at once when daily products are aggregated block by block
+AGGREGATION_WINDOW_ROWS = int(os.environ.get("AGGREGATION_WINDOW_ROWS", 256))
@@ -5,12 +5,17 @@ from typing import Tuple
 
 def grass_setup() -> Tuple[str, str, str, str]:
     """
-    Get GRASS configuration
+    Get GRASS configuration.
+    Empty values are returned when GRASS is not configured, so the in-memory
+    raster engine can run without a GRASS install.
     """
-    gisdb = os.environ["GISDBASE"]
-    location = os.environ["LOCATION"]
-    mapset = os.environ["MAPSET"]
-    gisbase = os.environ["GISBASE"]
+    gisdb = os.environ.get("GISDBASE", "")
+    location = os.environ.get("LOCATION", "")
+    mapset = os.environ.get("MAPSET", "")
+    gisbase = os.environ.get("GISBASE", "")
+    if not gisbase:
+        return gisbase, gisdb, location, mapset
+
     # The following not needed with trunk
     os.environ["PATH"] += os.pathsep + os.path.join(gisbase, "extrabin")
 
@@ -1,11 +1,11 @@
 import os
 import glob
-import numpy as np
 import datetime as dt
 import shutil
 from pathlib import Path
 from typing import Dict, List, Union
-from empatia.settings.constants import DEFAULT_DATE_FORMAT
+from empatia.settings.constants import DEFAULT_DATE_FORMAT, MIN_PERCENTAGE_OF_VALID_DATA
+from empatia.settings.log import logger
 
 
 def date_range(start: dt.date, end: dt.date) -> List[str]:
@@ -18,26 +18,6 @@ def date_range(start: dt.date, end: dt.date) -> List[str]:
     return date_list
 
 
-def get_qa_class(x: float) -> int:
-    _class = -9999
-    if np.isnan(x):
-        _class = -9999
-    elif (x > 0.1) and (x <= 54):
-        _class = 1
-    elif (x > 54) and (x <= 154):
-        _class = 2
-    elif (x > 154) and (x <= 254):
-        _class = 3
-    elif (x > 254) and (x <= 354):
-        _class = 4
-    elif (x > 354) and (x <= 424):
-        _class = 5
-    elif x > 424:
-        _class = 6
-
-    return _class
-
-
 def create_xml(xml_template: Union[str, Path], metadata: Dict, outfile: str) -> None:
 
     with open(xml_template, "r") as xml_file:
@@ -75,3 +55,14 @@ def remove_file(path: str) -> None:
         print(f"Deleted file: {path}")
     else:
         print(f"No {path} file to delete")
+
+
+def enough_valid_data_has_been_collected(
+    total_cells: int, number_of_null_cells: int
+) -> bool:
+    logger.info("Define if minimum amount of valid data has been collected...")
+    percent_of_null_cells = number_of_null_cells * 100 / total_cells
+    logger.info(f"Percent of nulls cells: {percent_of_null_cells}")
+    percent_of_valid_cells = 100 - percent_of_null_cells
+    logger.info(f"Percent of valid cells: {percent_of_valid_cells}")
+    return percent_of_valid_cells >= MIN_PERCENTAGE_OF_VALID_DATA
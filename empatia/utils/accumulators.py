@@ -0,0 +1,283 @@
+import json
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+import attr
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+from empatia.settings.constants import AGGREGATION_WINDOW_ROWS
+from empatia.settings.log import logger
+from empatia.utils.files import atomic_write, file_lock
+from empatia.utils.manifest import fingerprint
+from empatia.utils.stats import compute_file_stats, write_stats
+
+
+@attr.s
+class RasterAccumulator:
+    """
+    Running statistics of rasters on the domain grid: sum, count and,
+    optionally, sum of squares. It holds the daily PM10 predictions of a
+    month and sensor, or the VIIRS mosaics of a season.
+    Each product contribution is recorded with the fingerprint of its file,
+    so reprocessing a day replaces its contribution.
+    """
+
+    path = attr.ib(type=str)
+    total = attr.ib(type=np.ndarray)
+    total_sq = attr.ib(type=Optional[np.ndarray])
+    count = attr.ib(type=np.ndarray)
+    products = attr.ib(type=Dict[str, str], factory=dict)
+    stale = attr.ib(type=bool, default=False)
+    changed = attr.ib(type=bool, default=False, eq=False)
+
+    @classmethod
+    def empty(
+        cls, path: str, shape: Tuple[int, int], squares: bool = True
+    ) -> "RasterAccumulator":
+        """
+        Args:
+            path: accumulator file
+            shape: shape of the domain grid
+            squares: keep the sum of squares, needed for the standard deviation
+        """
+        total_sq = np.zeros(shape) if squares else None
+        return cls(path, np.zeros(shape), total_sq, np.zeros(shape))
+
+    @classmethod
+    def load(cls, path: str) -> Optional["RasterAccumulator"]:
+        if not os.path.exists(path):
+            return None
+
+        with np.load(path) as acc:
+            return cls(
+                path,
+                acc["total"],
+                acc["total_sq"] if "total_sq" in acc.files else None,
+                acc["count"],
+                json.loads(str(acc["products"])),
+                bool(acc["stale"]),
+            )
+
+    def add(
+        self, data: np.ndarray, sign: int = 1, window: Optional[Window] = None
+    ) -> None:
+        """
+        Add (or subtract, with sign=-1) the non-null cells of an array
+        Args:
+            data: array with NaN as null value
+            sign: 1 to add, -1 to subtract
+            window: if given, `data` only covers this window of the grid
+        """
+        cells = window.toslices() if window is not None else ...
+        total = self.total[cells]
+        valid = ~np.isnan(data)
+        total[valid] += sign * data[valid]
+        if self.total_sq is not None:
+            total_sq = self.total_sq[cells]
+            total_sq[valid] += sign * data[valid] ** 2
+        self.count[cells] += sign * valid
+        self.changed = True
+
+    def holds(self, product: str) -> bool:
+        """
+        Check if the accumulator holds the current version of a product
+        """
+        return self.products.get(Path(product).stem) == fingerprint([product])
+
+    def update(
+        self,
+        product: str,
+        data: np.ndarray,
+        old_data: Optional[np.ndarray],
+        old_fingerprint: Optional[str] = None,
+    ) -> None:
+        """
+        Record the contribution of a product, replacing the previous one
+        Args:
+            product: product file
+            data: product values, with NaN as null value
+            old_data: previous product values, if the product was overwritten
+            old_fingerprint: fingerprint of the file `old_data` was read from
+        """
+        if self.holds(product):
+            return
+
+        name = Path(product).stem
+        if name in self.products:
+            # The previous values can only be subtracted if they are the ones
+            # that were added
+            if old_data is not None and old_fingerprint == self.products[name]:
+                self.add(old_data, sign=-1)
+            else:
+                logger.info(f"Previous values of {name} are unknown")
+                self.stale = True
+
+        self.add(data)
+        self.products[name] = fingerprint([product])
+
+    def is_up_to_date(self, products: List[str]) -> bool:
+        """
+        Check if the accumulator holds exactly the current version of the products
+        """
+        return not self.stale and self.products == {
+            Path(product).stem: fingerprint([product]) for product in products
+        }
+
+    def reset(self) -> None:
+        for values in (self.total, self.total_sq, self.count):
+            if values is not None:
+                values.fill(0)
+        self.products = {}
+        self.stale = False
+        self.changed = True
+
+    def rebuild(self, products: List[str], mask: np.ndarray) -> None:
+        """
+        Rebuild the accumulator from the product files, reading them window by
+        window, so memory does not depend on the number of products
+        Args:
+            products: product files on the domain grid
+            mask: boolean array, True for cells inside the region
+        """
+        self.reset()
+        for window in get_row_windows(*mask.shape):
+            window_mask = mask[window.toslices()]
+            for product in products:
+                with rasterio.open(product) as src:
+                    data = src.read(1, window=window, masked=True)
+                data = data.astype(np.float64).filled(np.nan)
+                self.add(np.where(window_mask, data, np.nan), window=window)
+
+        self.products = {
+            Path(product).stem: fingerprint([product]) for product in products
+        }
+
+    def mean(self, window: Optional[Window] = None) -> np.ndarray:
+        cells = window.toslices() if window is not None else ...
+        total, count = self.total[cells], self.count[cells]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(count > 0, total / count, np.nan)
+
+    def stddev(self, window: Optional[Window] = None) -> np.ndarray:
+        if self.total_sq is None:
+            raise ValueError(f"{self.path} does not keep the sum of squares")
+
+        cells = window.toslices() if window is not None else ...
+        total, total_sq, count = (
+            self.total[cells],
+            self.total_sq[cells],
+            self.count[cells],
+        )
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = total / count
+            variance = np.maximum(total_sq / count - mean**2, 0)
+            return np.where(count > 0, np.sqrt(variance), np.nan)
+
+    def export(
+        self,
+        routput: str,
+        band_names: List[str],
+        profile: Dict[str, Any],
+        mask: np.ndarray,
+        nodata: int,
+    ) -> None:
+        """
+        Export mean, standard deviation and count to a multiband TIFF, window by
+        window. Statistics of every band are saved in a sidecar file.
+        Args:
+            routput: output raster map name
+            band_names: names of the mean, standard deviation and count bands
+            profile: domain grid
+            mask: boolean array, True for cells inside the region
+            nodata: int to fill null values
+        """
+        out_profile = {
+            **profile,
+            "driver": "GTiff",
+            "count": 3,
+            "dtype": "float32",
+            "nodata": nodata,
+        }
+        with rasterio.open(f"{routput}.tif", "w", **out_profile) as dst:
+            for window in get_row_windows(profile["height"], profile["width"]):
+                outside = ~mask[window.toslices()]
+                count = self.count[window.toslices()]
+                for band, values in enumerate(
+                    (self.mean(window), self.stddev(window), count), start=1
+                ):
+                    values = np.where(outside | np.isnan(values), nodata, values)
+                    dst.write(values.astype(np.float32), band, window=window)
+
+            for band, name in enumerate(band_names, start=1):
+                dst.set_band_description(band, name)
+
+        write_stats(routput, compute_file_stats(f"{routput}.tif"))
+
+    def save(self) -> None:
+        arrays: Dict[str, Any] = {
+            "total": self.total,
+            "count": self.count,
+            "products": json.dumps(self.products),
+            "stale": self.stale,
+        }
+        if self.total_sq is not None:
+            arrays["total_sq"] = self.total_sq
+        with atomic_write(self.path, ".npz") as tmp_path:
+            np.savez(tmp_path, **arrays)
+        self.changed = False
+
+
+def get_row_windows(height: int, width: int) -> Iterator[Window]:
+    """
+    Split a grid in windows of AGGREGATION_WINDOW_ROWS rows
+    """
+    for row in range(0, height, AGGREGATION_WINDOW_ROWS):
+        yield Window(0, row, width, min(AGGREGATION_WINDOW_ROWS, height - row))
+
+
+def get_monthly_accumulator_path(
+    accumulators_dir: Union[str, Path], sensor: str, year: int, month: int
+) -> str:
+    return f"{accumulators_dir}/{sensor.lower()}_{year}_{month:02d}.npz"
+
+
+@contextmanager
+def open_accumulator(
+    path: str, shape: Tuple[int, int], squares: bool = True
+) -> Iterator[RasterAccumulator]:
+    """
+    Load an accumulator, or create it if it does not exist, and save it back
+    if it changed.
+    The accumulator is locked while it is open, since daily workers of the
+    same month update it concurrently.
+    Args:
+        path: accumulator file
+        shape: shape of the domain grid
+        squares: keep the sum of squares, if the accumulator is created
+    """
+    with file_lock(path):
+        acc = RasterAccumulator.load(path) or RasterAccumulator.empty(
+            path, shape, squares
+        )
+        yield acc
+        if acc.changed:
+            acc.save()
+
+
+def read_prediction(rfile: Union[str, Path], mask: np.ndarray) -> np.ndarray:
+    """
+    Read a PM10 prediction as it is read by the raster engine with the mask applied
+    Args:
+        rfile: prediction file on the domain grid
+        mask: boolean array, True for cells inside the region
+    Returns:
+        Prediction values, with NaN as null value
+    """
+    with rasterio.open(rfile) as src:
+        data = src.read(1, masked=True).astype(np.float64).filled(np.nan)
+
+    return np.where(mask, data, np.nan)
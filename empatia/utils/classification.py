@@ -0,0 +1,67 @@
+from pathlib import Path
+from typing import List, Sequence, Union
+
+import attr
+import numpy as np
+
+from empatia.settings.constants import NODATA
+
+
+@attr.s(frozen=True)
+class BreakpointTable:
+    """
+    Table to reclassify values in a single pass.
+    The class `classes[i]` is assigned to values in
+    (breakpoints[i], breakpoints[i + 1]], the last class having no upper bound.
+    Values lower or equal than the first breakpoint and NaN are set to `nodata`.
+    """
+
+    breakpoints = attr.ib(type=List[float])
+    classes = attr.ib(type=Sequence[float])
+    nodata = attr.ib(type=int, default=NODATA)
+
+    @classes.validator
+    def _validate_classes(
+        self, attribute: attr.Attribute, value: Sequence[float]
+    ) -> None:
+        if len(value) != len(self.breakpoints):
+            raise ValueError("Breakpoints and classes must have the same length")
+        if list(self.breakpoints) != sorted(self.breakpoints):
+            raise ValueError("Breakpoints must be sorted")
+
+    def classify(self, values: np.ndarray) -> np.ndarray:
+        """
+        Reclassify an array
+        Args:
+            values: array of values
+        Returns:
+            Array of classes with the same shape as `values`
+        """
+        values = np.asarray(values, dtype=np.float64)
+        lookup = np.array([self.nodata, *self.classes])
+        classes: np.ndarray = lookup[np.digitize(values, self.breakpoints, right=True)]
+        classes[np.isnan(values)] = self.nodata
+        return classes
+
+
+def read_color_rules_values(rules: Union[str, Path]) -> List[float]:
+    """
+    Get the values defined in a color rules file
+    Args:
+        rules: file to define color table
+    Returns:
+        Values of the first column
+    """
+    values = []
+    with open(rules) as rules_file:
+        for line in rules_file:
+            fields = line.split()
+            if (
+                not fields
+                or fields[0].startswith("#")
+                or fields[0] in ("nv", "default")
+            ):
+                continue
+            values.append(float(fields[0]))
+
+    return values
@@ -0,0 +1,130 @@
+from pathlib import Path
+from typing import Any, Dict, Union
+
+import attr
+import gdal
+import numpy as np
+import rasterio
+from rasterio.warp import Resampling, reproject
+
+
+def get_domain_profile(domain_path: Union[str, Path]) -> Dict[str, Any]:
+    """
+    Get the grid of the domain
+    Args:
+        domain_path: raster file that defines the domain
+    Returns:
+        CRS, transform, width and height of the domain
+    """
+    with rasterio.open(domain_path) as src:
+        return {
+            "crs": src.crs,
+            "transform": src.transform,
+            "width": src.width,
+            "height": src.height,
+        }
+
+
+def rasterize_region(
+    region_path: Union[str, Path], profile: Dict[str, Any]
+) -> np.ndarray:
+    """
+    Rasterize the region polygons onto the domain grid
+    Args:
+        region_path: vector dir path
+        profile: domain grid
+    Returns:
+        Boolean array, True for cells inside the region
+    """
+    mem_ds = gdal.GetDriverByName("MEM").Create(
+        "", profile["width"], profile["height"], 1, gdal.GDT_Byte
+    )
+    mem_ds.SetGeoTransform(profile["transform"].to_gdal())
+    mem_ds.SetProjection(profile["crs"].to_wkt())
+    gdal.Rasterize(mem_ds, str(region_path), burnValues=[1])
+
+    return mem_ds.GetRasterBand(1).ReadAsArray().astype(bool)
+
+
+def to_domain_grid(
+    data: np.ndarray,
+    transform: Any,
+    crs: Any,
+    profile: Dict[str, Any],
+    resampling: Resampling = Resampling.nearest,
+) -> np.ndarray:
+    """
+    Resample an array onto the domain grid
+    Args:
+        data: 2D array, or 3D array of bands, with NaN as null value
+        transform: affine transform of the array
+        crs: georeference system of the array
+        profile: domain grid
+        resampling: resampling method
+    Returns:
+        Float64 array on the domain grid, with NaN as null value
+    """
+    destination = np.full(
+        data.shape[:-2] + (profile["height"], profile["width"]), np.nan
+    )
+    reproject(
+        source=data.astype(np.float64),
+        destination=destination,
+        src_transform=transform,
+        src_crs=crs,
+        src_nodata=np.nan,
+        dst_transform=profile["transform"],
+        dst_crs=profile["crs"],
+        dst_nodata=np.nan,
+        resampling=resampling,
+    )
+    return destination
+
+
+@attr.s
+class RegionGrid:
+    """
+    Domain grid and region mask, to build arrays as they would be read by a
+    raster engine with the mask applied
+    """
+
+    profile = attr.ib(type=Dict[str, Any])
+    mask = attr.ib(type=np.ndarray)
+
+
+def read_on_domain_grid(rfile: Union[str, Path], region: RegionGrid) -> np.ndarray:
+    """
+    Read a raster file onto the domain grid, as it is read by the raster engine
+    with the mask applied
+    Args:
+        rfile: raster file
+        region: domain grid and region mask
+    Returns:
+        Float64 array on the domain grid, with NaN as null value
+    """
+    with rasterio.open(rfile) as src:
+        data = src.read(1, masked=True).astype(np.float64).filled(np.nan)
+        data = to_domain_grid(data, src.transform, src.crs, region.profile)
+
+    return np.where(region.mask, data, np.nan)
+
+
+def write_domain_gtiff(
+    data: np.ndarray, rfile: Union[str, Path], profile: Dict[str, Any]
+) -> None:
+    """
+    Write an array on the domain grid to a Float64 TIFF, with NaN as null value
+    Args:
+        data: 2D array on the domain grid
+        rfile: output file
+        profile: domain grid
+    """
+    out_profile = {
+        **profile,
+        "driver": "GTiff",
+        "count": 1,
+        "dtype": "float64",
+        "nodata": np.nan,
+    }
+    with rasterio.open(rfile, "w", **out_profile) as dst:
+        dst.write(data, 1)
@@ -0,0 +1,44 @@
+"""
+Raster engine selection.
+Pipelines run raster operations through this module, which forwards every
+call to the selected engine. Engines are imported lazily, so GRASS is only
+required when the `grass` engine is used.
+"""
+
+import importlib
+from types import ModuleType
+from typing import Any, Optional
+
+from empatia.settings.constants import RASTER_ENGINE
+from empatia.settings.log import logger
+
+ENGINES = {
+    "grass": "empatia.utils.grass",
+    "memory": "empatia.utils.memory",
+}
+
+_engine: Optional[ModuleType] = None
+
+
+def use_engine(name: str) -> None:
+    """
+    Select the raster engine
+    Args:
+        name: engine name, one of ENGINES
+    """
+    global _engine
+    if name not in ENGINES:
+        raise ValueError(f"Invalid raster engine: {name}")
+
+    _engine = importlib.import_module(ENGINES[name])
+    logger.info(f"Using {name} raster engine")
+
+
+def get_engine() -> ModuleType:
+    if _engine is None:
+        use_engine(RASTER_ENGINE)
+    return _engine  # type: ignore
+
+
+def __getattr__(name: str) -> Any:
+    return getattr(get_engine(), name)
@@ -16,3 +16,9 @@ class FileDoesNotExist(EmpatiaBaseException):
     """
     The file provided does not exist.
     """
+
+
+class IncompleteDownload(EmpatiaBaseException):
+    """
+    The downloaded content is shorter than announced by the server.
+    """
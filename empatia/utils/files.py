@@ -0,0 +1,47 @@
+import fcntl
+import os
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Union
+
+
+@contextmanager
+def file_lock(path: Union[str, Path]) -> Iterator[None]:
+    """
+    Hold an exclusive lock on a file, shared by every process, through a
+    `.lock` file next to it
+    Args:
+        path: locked file
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(f"{path}.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@contextmanager
+def atomic_write(path: Union[str, Path], suffix: str = "") -> Iterator[str]:
+    """
+    Get a temporary file, unique to the writer, that replaces a file once it
+    is written. Readers never see a partial file, and the temporary file is
+    removed if writing fails.
+    Args:
+        path: file to write
+        suffix: suffix of the temporary file, for writers that add one
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=f"{name}.", suffix=f".tmp{suffix}", dir=directory
+    )
+    os.close(fd)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -1,61 +1,193 @@
+import glob
 import json
+import os
+import shlex
+import shutil
+import subprocess  # nosec
+import tempfile
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any, List, Tuple, Union
+from typing import Any, Dict, Iterator, List, Optional, Union
 
+import attr
 import grass.script as grass
+import numpy as np
 import grass.script.setup as gsetup
 from grass.script import array as garray
 
-from empatia.settings import GISBASE, GISDB, LOCATION, MAPSET
-from empatia.settings.constants import CELL_NULL_VALUE, MIN_PERCENTAGE_OF_VALID_DATA
+from empatia.settings import (
+    GISBASE,
+    GISDB,
+    LOCATION,
+    MAPSET,
+    REGION_MASK_CACHE_PATH,
+)
 from empatia.settings.log import logger
+from empatia.utils.classification import BreakpointTable
+from empatia.utils.mask import get_cached_mask, region_fingerprint
+from empatia.utils.stats import write_stats
 
 _ = gsetup.init(GISBASE, GISDB, LOCATION, MAPSET)
 
+WORKER_MAPSET_PREFIX = f"{MAPSET}_worker"
+REGION_MASK_NAME = "region_mask"
+REGION_GRID_KEYS = ("n", "s", "e", "w", "rows", "cols")
+
+
+@attr.s
+class CommandBatch:
+    """
+    GRASS commands of a stage, queued to be run by a single shell script
+    instead of launching a subprocess per command.
+    """
+
+    stage = attr.ib(type=str)
+    commands = attr.ib(type=List[List[str]], factory=list)
+    dropped = attr.ib(type=int, default=0)
+
+    def add(self, command: List[str]) -> None:
+        # Running the same command twice in a row has no effect
+        if self.commands and self.commands[-1] == command:
+            self.dropped += 1
+            return
+        self.commands.append(command)
+
+    def run(self) -> int:
+        """
+        Run the queued commands
+        Returns:
+            Number of module launches saved
+        """
+        if not self.commands:
+            return self.dropped
+
+        with tempfile.NamedTemporaryFile("w", suffix=".sh") as script:
+            script.write(
+                "\n".join(" ".join(map(shlex.quote, c)) for c in self.commands)
+            )
+            script.flush()
+            subprocess.run(["sh", "-e", script.name], check=True)  # nosec
+
+        saved = len(self.commands) - 1 + self.dropped
+        logger.info(
+            f"GRASS batch {self.stage}: {len(self.commands)} commands in one launch, "
+            f"{self.dropped} redundant commands dropped"
+        )
+        self.commands, self.dropped = [], 0
+        return saved
+
+
+_batch: Optional[CommandBatch] = None
+_launches_saved = 0
+# Region mask cells and fingerprint of the region mask raster in the current mapset
+_region_mask: Dict[str, Any] = {"cells": None, "fingerprint": None}
+
+
+def run_command(*args: Any, **kwargs: Any) -> None:
+    """
+    Run a GRASS module, or queue it if a batch is open
+    """
+    if _batch is None:
+        grass.run_command(*args, **kwargs)
+    else:
+        _batch.add([str(arg) for arg in grass.make_command(*args, **kwargs)])
+
+
+def flush_batch() -> None:
+    """
+    Run the queued commands. Called before any command whose output is needed.
+    """
+    global _launches_saved
+    if _batch is not None:
+        _launches_saved += _batch.run()
+
+
+@contextmanager
+def command_batch(stage: str) -> Iterator[None]:
+    """
+    Queue the GRASS commands run inside the context and run them together
+    at exit. Queued commands are discarded if the context raises.
+    Args:
+        stage: name of the stage, used to report the batch
+    """
+    global _batch
+    _batch = CommandBatch(stage)
+    try:
+        yield
+        flush_batch()
+    finally:
+        _batch = None
+
+
+def pop_launches_saved() -> int:
+    """
+    Get the number of module launches saved by batches since the last call
+    """
+    global _launches_saved
+    saved, _launches_saved = _launches_saved, 0
+    return saved
+
+
+def init_worker_mapset() -> str:
+    """
+    Create a temporary mapset for the current process and switch to it.
+    The mapset lives in the shared location, so every worker keeps its own
+    domain, mask and region without touching the main mapset.
+    Returns:
+        Name of the worker mapset
+    """
+    mapset = f"{WORKER_MAPSET_PREFIX}_{os.getpid()}"
+    mapset_path = os.path.join(GISDB, LOCATION, mapset)
+    if not os.path.exists(mapset_path):
+        os.makedirs(mapset_path)
+        shutil.copyfile(
+            os.path.join(GISDB, LOCATION, "PERMANENT", "DEFAULT_WIND"),
+            os.path.join(mapset_path, "WIND"),
+        )
+
+    gsetup.init(GISBASE, GISDB, LOCATION, mapset)
+    _forget_region_mask()
+    logger.info(f"Using GRASS mapset: {mapset}")
+    return mapset
+
+
+def remove_worker_mapsets() -> None:
+    """
+    Remove the temporary mapsets created by `init_worker_mapset`
+    """
+    pattern = os.path.join(GISDB, LOCATION, f"{WORKER_MAPSET_PREFIX}_*")
+    for mapset_path in glob.glob(pattern):
+        shutil.rmtree(mapset_path, ignore_errors=True)
+
 
 def clean_db() -> None:
     """
     Clean GRASS DB
     """
-    grass.run_command(
+    run_command(
         "g.remove",
         pattern="*",
         exclude="viirs_*",
         type="raster,vector",
         flags="f",
     )
-
-
-def raster2gtiff(rinput: str, routput: str) -> None:
-    """
-    Export raster map to TIFF
-    Args:
-        rinput: raster map name
-        routput: output raster map name
-    """
-    grass.run_command(
-        "r.out.gdal",
-        input=rinput,
-        output=routput + ".tif",
-        type="Float64",
-        flags="c",
-        overwrite=True,
-    )
+    _forget_region_mask()
 
 
 def export_multiband_gtiff(
     raster_names: List, group_name: str, routput: str, nodata: int = -9999
 ) -> None:
     """
-    Export raster maps to multiband TIFF
+    Export raster maps to multiband TIFF. Statistics of every band are saved
+    in a sidecar file next to the TIFF.
     Args:
         raster_names: raster map names
         group_name: name to create a group
         routput: output raster map name
         nodata: int to fill NaN values
     """
-    grass.run_command("i.group", group=group_name, input=",".join(raster_names))
-    grass.run_command(
+    run_command("i.group", group=group_name, input=",".join(raster_names))
+    run_command(
         "r.out.gdal",
         input=group_name,
         output=routput + ".tif",
@@ -64,6 +196,7 @@ def export_multiband_gtiff(
         nodata=nodata,
         overwrite=True,
     )
+    write_stats(routput, {rname: get_stats(rname) for rname in raster_names})
 
 
 def raster2csv(rinput: str, routput: str) -> None:
@@ -73,7 +206,7 @@ def raster2csv(rinput: str, routput: str) -> None:
         rinput: raster map name
         routput: output raster map name
     """
-    grass.run_command(
+    run_command(
         "r.out.xyz",
         input=rinput,
         output=routput + ".csv",
@@ -89,7 +222,7 @@ def raster2png(rinput: str, routput: str) -> None:
         rinput: raster map name
         routput: output raster map name
     """
-    grass.run_command(
+    run_command(
         "r.out.png",
         input=rinput,
         output=routput + ".png",
@@ -104,27 +237,9 @@ def set_domain(rfile: Union[str, Path]) -> None:
     Args:
         rfile: raster file name
     """
-    grass.run_command(
-        "r.in.gdal", input=rfile, output="domain", flags="e", overwrite=True
-    )
+    run_command("r.in.gdal", input=rfile, output="domain", flags="e", overwrite=True)
 
-    grass.run_command("g.region", raster="domain", flags="p", overwrite=True)
-
-
-def get_resampling(rinput: str) -> None:
-    """
-    Compute bilinear resampling for a given raster map
-    Args:
-        rinput: raster map name
-    """
-    logger.info("Set resampling...")
-    grass.run_command(
-        "r.resamp.interp",
-        input=rinput,
-        output=rinput,
-        method="bilinear",
-        overwrite=True,
-    )
+    run_command("g.region", raster="domain", flags="p", overwrite=True)
 
 
 def refresh_region() -> None:
@@ -132,70 +247,85 @@ def refresh_region() -> None:
     Refresh region
     """
     logger.info("Refresh region...")
-    grass.run_command("g.region", raster="domain", overwrite=True)
+    run_command("g.region", raster="domain", overwrite=True)
 
 
 def apply_mask(raster_dir: Union[str, Path]) -> Any:
     """
-    Creates a mask for limiting raster operations
+    Creates a mask for limiting raster operations.
+    The region is rasterized once and cached, so the mask is only rebuilt
+    when the vector files or the region change.
     Args:
         raster_dir: vector dir path
     """
     logger.info("Applying mask...")
-    grass.run_command(
-        "v.in.ogr", input=raster_dir, output="mask", flags="o", overwrite=True
+    flush_batch()
+    region = grass.region()
+    mask_fingerprint = region_fingerprint(
+        raster_dir, *(region[key] for key in REGION_GRID_KEYS)
     )
+    if _region_mask["fingerprint"] != mask_fingerprint:
+        _import_region_mask(raster_dir, mask_fingerprint)
 
-    grass.run_command("r.mask", vect="mask", overwrite="True")
+    run_command("r.mask", raster=REGION_MASK_NAME, overwrite=True)
+    flush_batch()
     region_data = grass.parse_command("g.region", flags="p")
     return json.loads(json.dumps(region_data))
 
 
-def get_number_of_null_values(raster_name: str) -> int:
-    stats_data = grass.parse_command(
-        "r.stats", flags="c", sort="desc", input=raster_name, null_value=CELL_NULL_VALUE
-    )
+def _import_region_mask(raster_dir: Union[str, Path], mask_fingerprint: str) -> None:
+    """
+    Create the region mask raster, from the cached array if it is up to date
+    or rasterizing the vector files otherwise
+    """
 
-    n_of_null_values = 0
-    for key in stats_data.keys():
-        logger.info(f"Current key: {key}")
-        if key.startswith(str(CELL_NULL_VALUE)):
-            n_of_null_values = int(key.split(" ")[1])
-            break
+    def rasterize() -> np.ndarray:
+        run_command(
+            "v.in.ogr", input=raster_dir, output="mask", flags="o", overwrite=True
+        )
+        run_command(
+            "v.to.rast",
+            input="mask",
+            output=REGION_MASK_NAME,
+            use="val",
+            value=1,
+            overwrite=True,
+        )
+        flush_batch()
+        raster = garray.array()
+        raster.read(REGION_MASK_NAME, null=0)
+        return np.asarray(raster) == 1
 
-    logger.info(f"RNAME: {raster_name}")
-    logger.info(f"NULLS: {n_of_null_values}")
-    return n_of_null_values
+    cells = get_cached_mask(REGION_MASK_CACHE_PATH, mask_fingerprint, rasterize)
+    raster = garray.array()
+    raster[...] = cells
+    raster.write(mapname=REGION_MASK_NAME, null=0, overwrite=True)
+    _region_mask.update(cells=cells, fingerprint=mask_fingerprint)
 
 
-def remove_mask() -> None:
-    """
-    Remove existing mask
-    """
-    grass.run_command("r.mask", flags="r")
+def _forget_region_mask() -> None:
+    _region_mask["fingerprint"] = None
 
 
-def import_gtiff(rfile: Union[str, Path], name: str) -> None:
+def get_region_mask() -> np.ndarray:
     """
-    Import raster file (TIFF) to GRASS
-    Args:
-        rfile: raster file name
-        name: raster map name
+    Get the cells of the last applied mask
+    Returns:
+        Boolean array, True for cells inside the region
     """
-    logger.info("Importing to gtiff...")
-    grass.run_command("r.in.gdal", input=rfile, output=name, flags="o", overwrite=True)
+    return _region_mask["cells"]
 
 
-def import_netcdf(rfile: Union[str, Path], band: int, name: str) -> None:
+def import_gtiff(rfile: Union[str, Path], name: str, band: int = 1) -> None:
     """
-    Import raster file (NETCDF) to GRASS
+    Import raster file (TIFF) to GRASS
     Args:
         rfile: raster file name
-        band: data index
         name: raster map name
+        band: band to import
     """
-    logger.info("Importing netcdf...")
-    grass.run_command(
+    logger.info("Importing to gtiff...")
+    run_command(
         "r.in.gdal", input=rfile, output=name, flags="o", band=band, overwrite=True
     )
 
@@ -207,7 +337,7 @@ def compute_mean(rasters: List, name: str) -> None:
         rasters: list of raster map names
         name: raster map name for the computed mean
     """
-    grass.run_command(
+    run_command(
         "r.series",
         input=",".join(rasters),
         method="average",
@@ -216,67 +346,40 @@ def compute_mean(rasters: List, name: str) -> None:
     )
 
 
-def compute_stddev(rasters: List, name: str) -> None:
+def get_stats(rinput: str) -> Dict[str, float]:
     """
-    Compute standard desviation for a set of raster maps
-    Args:
-        rasters: list of raster map names
-        name: raster map name for the computed standard desviation
-    """
-    grass.run_command(
-        "r.series",
-        input=",".join(rasters),
-        method="stddev",
-        output=name,
-        overwrite=True,
-    )
-
-
-def get_count(rasters: List, name: str) -> None:
-    """
-    Compute N for a set of raster maps
-    Args:
-        rasters: list of raster map names
-        name: raster map name for the computed N
-    """
-    grass.run_command(
-        "r.series",
-        input=",".join(rasters),
-        method="count",
-        output=name,
-        overwrite=True,
-    )
-
-
-def get_ranges(rinput: str) -> Tuple:
-    """
-    Compute Max and Min for a given raster map
+    Compute statistics for a given raster map without reading it into memory
     Args:
         rinput: raster map name
     Returns
-        Maximum and Minimum value of the raster
+        Minimum, maximum, mean, number of valid cells and number of null cells
     """
-    raster = garray.array()
-    raster.read(rinput)
+    flush_batch()
+    univar = grass.parse_command("r.univar", map=rinput, flags="g")
 
-    return str(raster.max()), str(raster.min())
+    return {
+        "min": float(univar.get("min", "nan")),
+        "max": float(univar.get("max", "nan")),
+        "mean": float(univar.get("mean", "nan")),
+        "valid_count": int(univar.get("n", 0)),
+        "null_count": int(univar.get("null_cells", 0)),
+    }
 
 
-def discretize_values(rinput: str, rule_func: Any, name: str) -> None:
+def discretize_values(rinput: str, table: BreakpointTable, name: str) -> None:
     """
     Discretize values of a given raster map
     Args:
         rinput: raster map name
-        rule_funct: function to assign classes
+        table: breakpoints to assign classes
         name: discretized raster map name
     """
+    flush_batch()
     raster = garray.array()
     raster.read(rinput)
 
     new_raster = garray.array()
-    for y in range(raster.shape[0]):
-        for x in range(raster.shape[1]):
-            new_raster[y, x] = rule_func(raster[y, x])
+    new_raster[...] = table.classify(raster)
 
     new_raster.write(mapname=f"{name}", overwrite=True)
 
@@ -288,19 +391,8 @@ def reset_color_table(rinput: str, rules: Union[str, Path]) -> None:
         rinput: raster map name
         rules: file to define color table
     """
-    grass.run_command(
+    run_command(
         "r.colors",
         map=rinput,
         rules=rules,
     )
-
-
-def enough_valid_data_has_been_collected(
-    total_cells: int, number_of_null_cells: int
-) -> bool:
-    logger.info("Define if minimum amount of valid data has been collected...")
-    percent_of_null_cells = number_of_null_cells * 100 / total_cells
-    logger.info(f"Percent of nulls cells: {percent_of_null_cells}")
-    percent_of_valid_cells = 100 - percent_of_null_cells
-    logger.info(f"Percent of valid cells: {percent_of_valid_cells}")
-    return percent_of_valid_cells >= MIN_PERCENTAGE_OF_VALID_DATA
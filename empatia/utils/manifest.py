@@ -0,0 +1,93 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Union
+
+import attr
+
+
+def fingerprint(files: Iterable[Union[str, Path]], *params: Any) -> str:
+    """
+    Fingerprint the inputs of a stage
+    Args:
+        files: input files, identified by name, size and modification time
+        params: any other value the stage depends on
+    Return:
+        Hex digest of the inputs
+    """
+    digest = hashlib.sha1()
+    for path in sorted(str(f) for f in files):
+        if os.path.exists(path):
+            stat = os.stat(path)
+            digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+        else:
+            digest.update(f"{path}:missing;".encode())
+
+    for param in params:
+        digest.update(f"{param!r};".encode())
+
+    return digest.hexdigest()
+
+
+@attr.s
+class StageManifest:
+    """
+    Record of the finished stages of a date. Each stage keeps, per key
+    (e.g. an orbit), the fingerprint of its inputs and the files it produced,
+    so a rerun only executes stale or missing stages.
+    """
+
+    path = attr.ib(type=str)
+    stages = attr.ib(type=Dict[str, Dict[str, Dict]], factory=dict)
+
+    @classmethod
+    def load(cls, path: str) -> "StageManifest":
+        stages = {}
+        if os.path.exists(path):
+            with open(path) as json_file:
+                stages = json.load(json_file)
+        return cls(path, stages)
+
+    def is_done(self, stage: str, key: str, fingerprint: str) -> bool:
+        """
+        Check if a stage finished with the same inputs and its outputs still exist
+        """
+        entry = self.stages.get(stage, {}).get(key)
+        if not entry or entry["fingerprint"] != fingerprint:
+            return False
+
+        return all(os.path.exists(output) for output in entry["outputs"])
+
+    def get_data(self, stage: str, key: str) -> Dict:
+        return self.stages.get(stage, {}).get(key, {}).get("data", {})
+
+    def mark_done(
+        self,
+        stage: str,
+        key: str,
+        fingerprint: str,
+        outputs: List[str],
+        data: Dict = None,
+    ) -> None:
+        """
+        Record a finished stage and save the manifest
+        Args:
+            stage: stage name
+            key: stage key, e.g. an orbit
+            fingerprint: fingerprint of the stage inputs
+            outputs: files produced by the stage
+            data: any other JSON serializable result of the stage
+        """
+        self.stages.setdefault(stage, {})[key] = {
+            "fingerprint": fingerprint,
+            "outputs": [str(output) for output in outputs],
+            "data": data or {},
+        }
+        self.save()
+
+    def save(self) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as outfile:
+            json.dump(self.stages, outfile, indent=4)
+        os.replace(tmp_path, self.path)
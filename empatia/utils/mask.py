@@ -0,0 +1,101 @@
+import os
+from pathlib import Path
+from typing import Any, Callable, Optional, Union
+
+import numpy as np
+
+from empatia.settings.log import logger
+from empatia.utils.files import atomic_write, file_lock
+from empatia.utils.manifest import fingerprint
+
+VECTOR_SUFFIXES = (".shp", ".shx", ".dbf", ".prj", ".cpg")
+
+
+def region_fingerprint(region_path: Union[str, Path], *grid: Any) -> str:
+    """
+    Fingerprint the region mask inputs
+    Args:
+        region_path: vector dir path
+        grid: values that define the grid the mask is rasterized onto
+    Returns:
+        Hex digest of the vector files and the grid
+    """
+    files = [
+        path
+        for path in Path(region_path).iterdir()
+        if path.suffix.lower() in VECTOR_SUFFIXES
+    ]
+    return fingerprint(files, *grid)
+
+
+def load_mask(
+    cache_path: Union[str, Path], mask_fingerprint: str
+) -> Optional[np.ndarray]:
+    """
+    Load a rasterized region mask from its cache
+    Args:
+        cache_path: cache file path
+        mask_fingerprint: fingerprint of the mask inputs
+    Returns:
+        Boolean array, True for cells inside the region, or None if the cache
+        does not exist or is stale
+    """
+    if not os.path.exists(cache_path):
+        return None
+
+    with np.load(cache_path) as cache:
+        if str(cache["fingerprint"]) != mask_fingerprint:
+            return None
+        height, width = cache["shape"]
+        cells = np.unpackbits(cache["cells"], count=height * width)
+
+    return cells.reshape(height, width).astype(bool)
+
+
+def save_mask(
+    cache_path: Union[str, Path], mask_fingerprint: str, cells: np.ndarray
+) -> None:
+    """
+    Save a rasterized region mask as a packed boolean array
+    Args:
+        cache_path: cache file path
+        mask_fingerprint: fingerprint of the mask inputs
+        cells: boolean array, True for cells inside the region
+    """
+    with atomic_write(cache_path, ".npz") as tmp_path:
+        np.savez(
+            tmp_path,
+            fingerprint=mask_fingerprint,
+            shape=np.array(cells.shape),
+            cells=np.packbits(cells.astype(bool)),
+        )
+
+
+def get_cached_mask(
+    cache_path: Union[str, Path],
+    mask_fingerprint: str,
+    rasterize: Callable[[], np.ndarray],
+) -> np.ndarray:
+    """
+    Load a region mask from its cache, or rasterize and cache it if the cache
+    does not exist or is stale. Workers that apply the mask at once wait for
+    the first one to rasterize it.
+    Args:
+        cache_path: cache file path
+        mask_fingerprint: fingerprint of the mask inputs
+        rasterize: function that rasterizes the mask
+    Returns:
+        Boolean array, True for cells inside the region
+    """
+    cells = load_mask(cache_path, mask_fingerprint)
+    if cells is not None:
+        return cells
+
+    with file_lock(cache_path):
+        cells = load_mask(cache_path, mask_fingerprint)
+        if cells is None:
+            logger.info("Rasterizing region mask...")
+            cells = rasterize()
+            save_mask(cache_path, mask_fingerprint, cells)
+
+    return cells
@@ -0,0 +1,314 @@
+"""
+In-memory raster engine.
+Implements the raster operations of `empatia.utils.grass` on NumPy arrays
+aligned to the domain grid, using rasterio/GDAL in-process. Raster maps are
+kept in a dictionary by name, and the mask is applied when they are read,
+as GRASS does.
+"""
+
+import warnings
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+import attr
+import numpy as np
+import rasterio
+
+from empatia.settings import REGION_MASK_CACHE_PATH
+from empatia.settings.log import logger
+from empatia.utils.classification import BreakpointTable
+from empatia.utils.domain import get_domain_profile, rasterize_region, to_domain_grid
+from empatia.utils.mask import get_cached_mask, region_fingerprint
+from empatia.utils.stats import write_stats
+
+DEFAULT_COLOR = 255  # GRASS renders values out of the color rules in white
+
+
+@attr.s
+class RasterMap:
+    """
+    Raster map stored in memory. Imported maps keep their own grid until
+    they are resampled or read onto the domain grid.
+    """
+
+    data = attr.ib(type=np.ndarray)
+    transform = attr.ib(type=Any, default=None)
+    crs = attr.ib(type=Any, default=None)
+    color_rules = attr.ib(type=Optional[str], default=None)
+
+
+_domain: Dict[str, Any] = {}
+_rasters: Dict[str, RasterMap] = {}
+_mask: Dict[str, Any] = {"cells": None, "fingerprint": None, "active": False}
+
+
+def _read(name: str) -> np.ndarray:
+    """
+    Read a raster map onto the domain grid, with the mask applied if active
+    """
+    raster = _rasters[name]
+    if raster.transform is not None:
+        raster.data = to_domain_grid(raster.data, raster.transform, raster.crs, _domain)
+        raster.transform, raster.crs = None, None
+
+    if not _mask["active"]:
+        return raster.data
+    return np.where(_mask["cells"], raster.data, np.nan)
+
+
+def _write(name: str, data: np.ndarray) -> None:
+    _rasters[name] = RasterMap(data.astype(np.float64))
+
+
+def _import(rfile: Union[str, Path], band: int, name: str) -> None:
+    with rasterio.open(rfile) as src:
+        data = src.read(band, masked=True).astype(np.float64).filled(np.nan)
+        _rasters[name] = RasterMap(data, src.transform, src.crs)
+
+
+def _profile(count: int, dtype: str, nodata: float) -> Dict[str, Any]:
+    return {
+        "driver": "GTiff",
+        "crs": _domain["crs"],
+        "transform": _domain["transform"],
+        "width": _domain["width"],
+        "height": _domain["height"],
+        "count": count,
+        "dtype": dtype,
+        "nodata": nodata,
+    }
+
+
+def clean_db() -> None:
+    """
+    Clean in-memory raster maps
+    """
+    for name in [name for name in _rasters if not name.startswith("viirs_")]:
+        del _rasters[name]
+
+
+def init_worker_mapset() -> str:
+    """
+    Workers do not share memory, so they are already isolated
+    """
+    return "memory"
+
+
+def remove_worker_mapsets() -> None:
+    pass
+
+
+@contextmanager
+def command_batch(stage: str) -> Iterator[None]:
+    """
+    Operations run in-process, there are no commands to batch
+    """
+    yield
+
+
+def flush_batch() -> None:
+    pass
+
+
+def pop_launches_saved() -> int:
+    return 0
+
+
+def export_multiband_gtiff(
+    raster_names: List, group_name: str, routput: str, nodata: int = -9999
+) -> None:
+    """
+    Export raster maps to multiband TIFF. Statistics of every band are saved
+    in a sidecar file next to the TIFF.
+    Args:
+        raster_names: raster map names
+        group_name: name to create a group
+        routput: output raster map name
+        nodata: int to fill NaN values
+    """
+    profile = _profile(len(raster_names), "float32", nodata)
+    with rasterio.open(f"{routput}.tif", "w", **profile) as dst:
+        for band, rname in enumerate(raster_names, start=1):
+            dst.write(np.nan_to_num(_read(rname), nan=nodata), band)
+            dst.set_band_description(band, rname)
+    write_stats(routput, {rname: get_stats(rname) for rname in raster_names})
+
+
+def raster2png(rinput: str, routput: str) -> None:
+    """
+    Export raster map to PNG, with transparent null cells
+    Args:
+        rinput: raster map name
+        routput: output raster map name
+    """
+    data = _read(rinput)
+    valid = ~np.isnan(data)
+    rgba = np.zeros((4,) + data.shape, dtype=np.uint8)
+    rgba[3][valid] = 255
+
+    rules = _rasters[rinput].color_rules
+    if rules:
+        values, colors = _read_color_rules(rules)
+        inside = valid & (data >= values[0]) & (data <= values[-1])
+        for band in range(3):
+            rgba[band][valid] = DEFAULT_COLOR
+            rgba[band][inside] = np.interp(data[inside], values, colors[:, band])
+    elif valid.any():
+        _min, _max = np.nanmin(data), np.nanmax(data)
+        gray = (data[valid] - _min) * 255 / ((_max - _min) or 1)
+        rgba[:3, valid] = gray.astype(np.uint8)
+
+    profile = {
+        "driver": "PNG",
+        "width": data.shape[1],
+        "height": data.shape[0],
+        "count": 4,
+        "dtype": "uint8",
+    }
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", rasterio.errors.NotGeoreferencedWarning)
+        with rasterio.open(f"{routput}.png", "w", **profile) as dst:
+            dst.write(rgba)
+
+
+def _read_color_rules(rules: Union[str, Path]) -> Tuple[np.ndarray, np.ndarray]:
+    values, colors = [], []
+    with open(rules) as rules_file:
+        for line in rules_file:
+            fields = line.split()
+            if len(fields) != 2 or fields[0] in ("nv", "default"):
+                continue
+            values.append(float(fields[0]))
+            colors.append([int(c) for c in fields[1].split(":")])
+
+    return np.array(values), np.array(colors)
+
+
+def set_domain(rfile: Union[str, Path]) -> None:
+    """
+    Set region from a given raster map
+    Args:
+        rfile: raster file name
+    """
+    _domain.update(get_domain_profile(rfile))
+    _import(rfile, 1, "domain")
+
+
+def refresh_region() -> None:
+    """
+    Every raster map is read onto the domain grid, there is no region to refresh
+    """
+
+
+def apply_mask(raster_dir: Union[str, Path]) -> Any:
+    """
+    Creates a mask for limiting raster operations
+    Args:
+        raster_dir: vector dir path
+    Returns:
+        Region data, with the same keys as `g.region -p`
+    """
+    logger.info("Applying mask...")
+    mask_fingerprint = region_fingerprint(
+        raster_dir, _domain["transform"], _domain["width"], _domain["height"]
+    )
+    if _mask["fingerprint"] != mask_fingerprint:
+        cells = get_cached_mask(
+            REGION_MASK_CACHE_PATH,
+            mask_fingerprint,
+            lambda: rasterize_region(raster_dir, _domain),
+        )
+        _mask.update(cells=cells, fingerprint=mask_fingerprint)
+    _mask["active"] = True
+
+    return {f"cells: {_domain['width'] * _domain['height']}": None}
+
+
+def get_region_mask() -> np.ndarray:
+    """
+    Get the cells of the last applied mask
+    Returns:
+        Boolean array, True for cells inside the region
+    """
+    return _mask["cells"]
+
+
+def import_gtiff(rfile: Union[str, Path], name: str, band: int = 1) -> None:
+    """
+    Import raster file (TIFF) to memory
+    Args:
+        rfile: raster file name
+        name: raster map name
+        band: band to import
+    """
+    logger.info("Importing to gtiff...")
+    _import(rfile, band, name)
+
+
+def compute_mean(rasters: List, name: str) -> None:
+    """
+    Compute mean for a set of raster maps, reading one map at a time
+    Args:
+        rasters: list of raster map names
+        name: raster map name for the computed mean
+    """
+    shape = (_domain["height"], _domain["width"])
+    total, count = np.zeros(shape), np.zeros(shape)
+    for rname in rasters:
+        data = _read(rname)
+        valid = ~np.isnan(data)
+        total[valid] += data[valid]
+        count += valid
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        _write(name, np.where(count > 0, total / count, np.nan))
+
+
+def get_stats(rinput: str) -> Dict[str, float]:
+    """
+    Compute statistics for a given raster map
+    Args:
+        rinput: raster map name
+    Returns
+        Minimum, maximum, mean, number of valid cells and number of null cells
+    """
+    data = _read(rinput)
+    values = data[~np.isnan(data)]
+    if not values.size:
+        return {
+            "min": np.nan,
+            "max": np.nan,
+            "mean": np.nan,
+            "valid_count": 0,
+            "null_count": int(data.size),
+        }
+
+    return {
+        "min": float(values.min()),
+        "max": float(values.max()),
+        "mean": float(values.mean()),
+        "valid_count": int(values.size),
+        "null_count": int(data.size - values.size),
+    }
+
+
+def discretize_values(rinput: str, table: BreakpointTable, name: str) -> None:
+    """
+    Discretize values of a given raster map
+    Args:
+        rinput: raster map name
+        table: breakpoints to assign classes
+        name: discretized raster map name
+    """
+    _write(name, table.classify(_read(rinput)))
+
+
+def reset_color_table(rinput: str, rules: Union[str, Path]) -> None:
+    """
+    Reset color table for a given raster map
+    Args:
+        rinput: raster map name
+        rules: file to define color table
+    """
+    _rasters[rinput].color_rules = str(rules)
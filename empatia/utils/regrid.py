@@ -0,0 +1,286 @@
+import hashlib
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple, Union
+
+import attr
+import numpy as np
+from rasterio.crs import CRS
+from rasterio.warp import transform
+from scipy import sparse
+
+from empatia.settings.log import logger
+from empatia.utils.files import atomic_write, file_lock
+
+BUILD_BLOCK_ROWS = 256
+# Regridders kept in memory, the least recently used are dropped first
+MAX_CACHED_REGRIDDERS = 8
+
+_regridders: "OrderedDict[str, BilinearRegridder]" = OrderedDict()
+
+
+@attr.s
+class BilinearRegridder:
+    """
+    Bilinear interpolation between two grids, as a sparse matrix of weights
+    from source to destination cells.
+    As `r.resamp.interp`, destination cells whose four source neighbours are
+    not all inside the source grid, or are null, are set to null. With
+    `skip_nulls`, as GDAL warps, null neighbours and neighbours outside the
+    source grid are skipped and the weights of the others are renormalized,
+    and only cells whose nearest source cell is null are set to null.
+    """
+
+    matrix = attr.ib(type=sparse.csr_matrix)
+    dst_shape = attr.ib(type=Tuple[int, int])
+    nearest = attr.ib(type=Optional[np.ndarray], default=None)
+
+    @property
+    def skip_nulls(self) -> bool:
+        return self.nearest is not None
+
+    @property
+    def valid(self) -> np.ndarray:
+        return np.asarray(np.diff(self.matrix.indptr) > 0)
+
+    @classmethod
+    def build(
+        cls,
+        src_transform: Any,
+        src_shape: Tuple[int, int],
+        dst_transform: Any,
+        dst_shape: Tuple[int, int],
+        src_crs: Any = None,
+        dst_crs: Any = None,
+        skip_nulls: bool = False,
+    ) -> "BilinearRegridder":
+        """
+        Compute the interpolation weights
+        Args:
+            src_transform: affine transform of the source grid
+            src_shape: rows and columns of the source grid
+            dst_transform: affine transform of the destination grid
+            dst_shape: rows and columns of the destination grid
+            src_crs: georeference system of the source grid, if it is not the
+                same as the destination one
+            dst_crs: georeference system of the destination grid
+            skip_nulls: skip null neighbours instead of nulling the cell
+        """
+        src_rows, src_cols = src_shape
+        dst_rows, dst_cols = dst_shape
+
+        # Weights are computed by blocks of destination rows to bound memory
+        weights, dst_cells, src_cells, nearest = [], [], [], []
+        for start in range(0, dst_rows, BUILD_BLOCK_ROWS):
+            block = np.arange(start, min(start + BUILD_BLOCK_ROWS, dst_rows))
+            rows, cols = get_source_indexes(
+                src_transform, src_crs, dst_transform, dst_crs, block, dst_cols
+            )
+            known = np.isfinite(rows) & np.isfinite(cols)
+            row0 = np.floor(np.where(known, rows, -2)).astype(int)
+            col0 = np.floor(np.where(known, cols, -2)).astype(int)
+            drow, dcol = rows - row0, cols - col0
+
+            neighbours = [
+                (row0, col0, (1 - drow) * (1 - dcol)),
+                (row0, col0 + 1, (1 - drow) * dcol),
+                (row0 + 1, col0, drow * (1 - dcol)),
+                (row0 + 1, col0 + 1, drow * dcol),
+            ]
+            inside = [
+                (row >= 0) & (row < src_rows) & (col >= 0) & (col < src_cols)
+                for row, col, _ in neighbours
+            ]
+            if skip_nulls:
+                nearest_row = np.floor(np.where(known, rows, -2) + 0.5).astype(int)
+                nearest_col = np.floor(np.where(known, cols, -2) + 0.5).astype(int)
+                nearest_inside = (
+                    (nearest_row >= 0)
+                    & (nearest_row < src_rows)
+                    & (nearest_col >= 0)
+                    & (nearest_col < src_cols)
+                )
+                nearest.append(
+                    np.where(
+                        nearest_inside, nearest_row * src_cols + nearest_col, -1
+                    ).ravel()
+                )
+            else:
+                all_inside = np.logical_and.reduce(inside)
+                inside = [all_inside] * len(neighbours)
+
+            cells = block[:, None] * dst_cols + np.arange(dst_cols)
+            for (row, col, weight), keep in zip(neighbours, inside):
+                weights.append(weight[keep])
+                dst_cells.append(cells[keep])
+                src_cells.append(row[keep] * src_cols + col[keep])
+
+        matrix = sparse.csr_matrix(
+            (
+                np.concatenate(weights),
+                (np.concatenate(dst_cells), np.concatenate(src_cells)),
+            ),
+            shape=(dst_rows * dst_cols, src_rows * src_cols),
+        )
+        return cls(matrix, dst_shape, np.concatenate(nearest) if skip_nulls else None)
+
+    @classmethod
+    def load(
+        cls,
+        cache_dir: Union[str, Path],
+        src_transform: Any,
+        src_shape: Tuple[int, int],
+        dst_transform: Any,
+        dst_shape: Tuple[int, int],
+        src_crs: Any = None,
+        dst_crs: Any = None,
+        skip_nulls: bool = False,
+    ) -> "BilinearRegridder":
+        """
+        Get the regridder between two grids, computing and caching it on disk
+        the first time
+        Args:
+            cache_dir: directory of cached regridders
+            src_transform: affine transform of the source grid
+            src_shape: rows and columns of the source grid
+            dst_transform: affine transform of the destination grid
+            dst_shape: rows and columns of the destination grid
+            src_crs: georeference system of the source grid, if it is not the
+                same as the destination one
+            dst_crs: georeference system of the destination grid
+            skip_nulls: skip null neighbours instead of nulling the cell
+        """
+        grids: Tuple[Any, ...] = (tuple(src_transform), tuple(src_shape))
+        grids += (tuple(dst_transform), tuple(dst_shape))
+        if src_crs is not None and dst_crs is not None and src_crs != dst_crs:
+            grids += (CRS.from_user_input(src_crs).to_wkt(),)
+            grids += (CRS.from_user_input(dst_crs).to_wkt(),)
+        if skip_nulls:
+            grids += ("skip_nulls",)
+        key = hashlib.sha1(repr(grids).encode()).hexdigest()
+        if key in _regridders:
+            _regridders.move_to_end(key)
+            return _regridders[key]
+
+        cache_path = f"{cache_dir}/bilinear_{key}.npz"
+        regridder = cls.from_cache(cache_path, dst_shape)
+        if regridder is None:
+            # Workers that need the same regridder wait for the first one to
+            # build it
+            with file_lock(cache_path):
+                regridder = cls.from_cache(cache_path, dst_shape)
+                if regridder is None:
+                    regridder = cls.build(
+                        src_transform,
+                        src_shape,
+                        dst_transform,
+                        dst_shape,
+                        src_crs,
+                        dst_crs,
+                        skip_nulls,
+                    )
+                    regridder.save(cache_path)
+
+        _regridders[key] = regridder
+        if len(_regridders) > MAX_CACHED_REGRIDDERS:
+            _regridders.popitem(last=False)
+        return regridder
+
+    @classmethod
+    def from_cache(
+        cls, cache_path: str, dst_shape: Tuple[int, int]
+    ) -> Optional["BilinearRegridder"]:
+        """
+        Read a cached regridder, None if it is not cached or it can not be read
+        """
+        if not os.path.exists(cache_path):
+            return None
+
+        try:
+            with np.load(cache_path) as cached:
+                return cls(
+                    sparse.csr_matrix(
+                        (cached["data"], cached["indices"], cached["indptr"]),
+                        shape=tuple(cached["shape"]),
+                    ),
+                    dst_shape,
+                    cached["nearest"] if "nearest" in cached.files else None,
+                )
+        except Exception as e:
+            logger.info(
+                f"Cached regridder {cache_path} is unreadable, rebuilding it: {e}"
+            )
+            return None
+
+    def save(self, cache_path: str) -> None:
+        arrays: Dict[str, Any] = {
+            "data": self.matrix.data,
+            "indices": self.matrix.indices,
+            "indptr": self.matrix.indptr,
+            "shape": self.matrix.shape,
+        }
+        if self.nearest is not None:
+            arrays["nearest"] = self.nearest
+        with atomic_write(cache_path, ".npz") as tmp_path:
+            np.savez_compressed(tmp_path, **arrays)
+
+    def regrid(self, data: np.ndarray) -> np.ndarray:
+        """
+        Interpolate arrays of the source grid
+        Args:
+            data: (..., rows, columns) array, with NaN as null value
+        Returns:
+            (..., rows, columns) array on the destination grid
+        """
+        bands = data.reshape(-1, data.shape[-2] * data.shape[-1]).T
+        if self.nearest is not None:
+            known = ~np.isnan(bands)
+            weights = self.matrix @ known.astype(np.float64)
+            regridded = self.matrix @ np.where(known, bands, 0)
+            nearest_known = np.zeros(regridded.shape, dtype=bool)
+            inside = self.nearest >= 0
+            nearest_known[inside] = known[self.nearest[inside]]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                regridded = np.where(
+                    nearest_known & (weights > 0), regridded / weights, np.nan
+                )
+        else:
+            regridded = self.matrix @ bands
+            regridded[~self.valid] = np.nan
+        return np.asarray(regridded.T.reshape(data.shape[:-2] + tuple(self.dst_shape)))
+
+
+def get_source_indexes(
+    src_transform: Any,
+    src_crs: Any,
+    dst_transform: Any,
+    dst_crs: Any,
+    dst_rows: np.ndarray,
+    dst_cols: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Locate destination cell centers in a source grid
+    Args:
+        src_transform: affine transform of the source grid
+        src_crs: georeference system of the source grid, None if it is the
+            same as the destination one
+        dst_transform: affine transform of the destination grid
+        dst_crs: georeference system of the destination grid
+        dst_rows: destination rows to locate
+        dst_cols: columns of the destination grid
+    Returns:
+        Fractional row and column indexes of source cell centers, as
+        (rows, columns) arrays
+    """
+    xs = dst_transform.c + dst_transform.a * (np.arange(dst_cols) + 0.5)
+    ys = dst_transform.f + dst_transform.e * (dst_rows + 0.5)
+    xs, ys = np.meshgrid(xs, ys)
+    if src_crs is not None and dst_crs is not None and src_crs != dst_crs:
+        src_xs, src_ys = transform(dst_crs, src_crs, xs.ravel(), ys.ravel())
+        xs = np.asarray(src_xs).reshape(xs.shape)
+        ys = np.asarray(src_ys).reshape(ys.shape)
+
+    cols = (xs - src_transform.c) / src_transform.a - 0.5
+    rows = (ys - src_transform.f) / src_transform.e - 0.5
+    return rows, cols
@@ -0,0 +1,87 @@
+import json
+import math
+import os
+from typing import Dict, Tuple
+
+import numpy as np
+import rasterio
+
+from empatia.settings.log import logger
+
+STATS_SUFFIX = ".stats.json"
+
+
+def write_stats(product: str, stats: Dict[str, Dict]) -> None:
+    """
+    Save the statistics of a product in a sidecar file
+    Args:
+        product: product path without extension
+        stats: statistics per band name
+    """
+    with open(f"{product}{STATS_SUFFIX}", "w") as outfile:
+        json.dump(stats, outfile, indent=4)
+
+
+def read_stats(product: str) -> Dict[str, Dict]:
+    """
+    Get the statistics of a product from its sidecar file.
+    If the sidecar does not exist, they are computed from the GTiff and saved.
+    Args:
+        product: product path without extension
+    Returns:
+        Statistics per band name
+    """
+    sidecar = f"{product}{STATS_SUFFIX}"
+    if os.path.exists(sidecar):
+        with open(sidecar) as json_file:
+            return json.load(json_file)
+
+    logger.info(f"No statistics found for {product}, computing them...")
+    stats = compute_file_stats(f"{product}.tif")
+    write_stats(product, stats)
+    return stats
+
+
+def get_stats_ranges(stats: Dict[str, Dict], band: str) -> Tuple[str, str]:
+    """
+    Get Max and Min of a band
+    Returns
+        Maximum and Minimum value of the band
+    """
+    return str(stats[band]["max"]), str(stats[band]["min"])
+
+
+def compute_file_stats(rfile: str) -> Dict[str, Dict]:
+    """
+    Compute statistics of every band of a raster file reading it block by block
+    Args:
+        rfile: raster file name
+    Returns:
+        Statistics per band name
+    """
+    stats = {}
+    with rasterio.open(rfile) as src:
+        for band in range(1, src.count + 1):
+            _min, _max, total = math.inf, -math.inf, 0.0
+            valid_count, null_count = 0, 0
+            for _, window in src.block_windows(band):
+                data = src.read(band, window=window, masked=True)
+                values = data.compressed()
+                values = values[~np.isnan(values)]
+                null_count += data.size - values.size
+                if values.size:
+                    _min = min(_min, float(values.min()))
+                    _max = max(_max, float(values.max()))
+                    total += float(values.sum(dtype=np.float64))
+                    valid_count += int(values.size)
+
+            name = src.descriptions[band - 1] or f"band_{band}"
+            stats[name] = {
+                "min": _min if valid_count else math.nan,
+                "max": _max if valid_count else math.nan,
+                "mean": total / valid_count if valid_count else math.nan,
+                "valid_count": valid_count,
+                "null_count": null_count,
+            }
+
+    return stats
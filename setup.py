@@ -16,6 +16,7 @@ setup(
         "pandas",
         "requests",
         "scikit-learn",
+        "scipy",
         "tqdm",
     ],
     entry_points="""
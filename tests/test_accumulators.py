@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+import rasterio
+from rasterio.crs import CRS
+from rasterio.transform import from_origin
+
+from empatia.utils.accumulators import RasterAccumulator, open_accumulator
+from empatia.utils.manifest import fingerprint
+
+SHAPE = (4, 5)
+PROFILE = {
+    "driver": "GTiff",
+    "crs": CRS.from_epsg(4326),
+    "transform": from_origin(-70, -26, 0.1, 0.1),
+    "width": SHAPE[1],
+    "height": SHAPE[0],
+    "count": 1,
+    "dtype": "float64",
+}
+
+
+def write_product(path, value, mtime):
+    data = np.full(SHAPE, float(value))
+    with rasterio.open(path, "w", **PROFILE) as dst:
+        dst.write(data, 1)
+    # Distinct modification times, so every version has its own fingerprint
+    os.utime(path, ns=(mtime, mtime))
+    return data
+
+
+def test_update_replaces_the_previous_version(tmp_path):
+    product = str(tmp_path / "PM10_20210101_140000_v001.tif")
+    acc = RasterAccumulator.empty(str(tmp_path / "acc.npz"), SHAPE)
+    old_data = write_product(product, 10, 1)
+    acc.update(product, old_data, None)
+    old_fingerprint = fingerprint([product])
+
+    data = write_product(product, 30, 2)
+    acc.update(product, data, old_data, old_fingerprint)
+
+    assert not acc.stale
+    assert acc.is_up_to_date([product])
+    np.testing.assert_array_equal(acc.mean(), data)
+
+
+def test_update_with_a_mismatched_old_file(tmp_path):
+    product = str(tmp_path / "PM10_20210101_140000_v001.tif")
+    acc = RasterAccumulator.empty(str(tmp_path / "acc.npz"), SHAPE)
+    acc.update(product, write_product(product, 10, 1), None)
+    # The product is overwritten without updating the accumulator, so the
+    # values read before predicting again are not the ones it holds
+    old_data = write_product(product, 20, 2)
+    old_fingerprint = fingerprint([product])
+
+    acc.update(product, write_product(product, 30, 3), old_data, old_fingerprint)
+
+    assert acc.stale
+    assert not acc.is_up_to_date([product])
+    acc.rebuild([product], np.ones(SHAPE, dtype=bool))
+    np.testing.assert_array_equal(acc.mean(), np.full(SHAPE, 30.0))
+
+
+def test_open_accumulator_saves_only_changes(tmp_path):
+    product = str(tmp_path / "PM10_20210101_140000_v001.tif")
+    path = str(tmp_path / "acc.npz")
+    data = write_product(product, 10, 1)
+    with open_accumulator(path, SHAPE) as acc:
+        acc.update(product, data, None)
+    mtime = os.stat(path).st_mtime_ns
+
+    with open_accumulator(path, SHAPE) as acc:
+        assert acc.holds(product)
+        acc.update(product, data, None)
+
+    assert os.stat(path).st_mtime_ns == mtime
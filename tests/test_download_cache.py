@@ -0,0 +1,35 @@
+import pytest
+
+from empatia.etl.download_cache import DownloadCache, get_checksum
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return DownloadCache(str(tmp_path / "index.json"))
+
+
+@pytest.fixture
+def product(tmp_path):
+    path = tmp_path / "product.hdf"
+    path.write_bytes(b"contents")
+    return str(path)
+
+
+def test_files_on_disk_are_indexed(cache, product):
+    assert cache.is_valid("key", product)
+    assert cache._read()["key"]["path"] == product
+
+
+def test_files_on_disk_are_checked(cache, product):
+    assert not cache.is_valid("key", product, size=1)
+    assert not cache.is_valid("key", product, sha256="0" * 64)
+    assert cache.is_valid("key", product, size=8, sha256=get_checksum(product))
+
+
+def test_corrupt_files_are_not_valid(cache, product):
+    cache.add("key", product)
+    with open(product, "ab") as f:
+        f.write(b"!")
+
+    assert not cache.is_valid("key", product)
+    assert "key" not in cache._read()
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from scipy.io import netcdf_file
+
+from empatia.etl.merra_cube import MerraCube
+
+TIMES, LEVELS, LATS, LONS = 3, [71.0, 72.0], 4, 5
+
+
+def write_merra_file(path):
+    """
+    Write a MERRA file with a variable by time and one by time and level.
+    Values are time * 100 + level.
+    """
+    times = np.arange(TIMES, dtype=np.float64)
+    with netcdf_file(path, "w") as nc:
+        for name, values in (
+            ("time", times),
+            ("lev", np.array(LEVELS)),
+            ("lat", np.linspace(-30, -27, LATS)),
+            ("lon", np.linspace(-70, -66, LONS)),
+        ):
+            nc.createDimension(name, len(values))
+            nc.createVariable(name, "f8", (name,))[:] = values
+        nc.variables["lat"].units = "degrees_north"
+        nc.variables["lon"].units = "degrees_east"
+
+        ps = nc.createVariable("PS", "f4", ("time", "lat", "lon"))
+        ps[:] = np.broadcast_to(times[:, None, None] * 100, (TIMES, LATS, LONS))
+        t = nc.createVariable("T", "f4", ("time", "lev", "lat", "lon"))
+        values = times[:, None] * 100 + np.array(LEVELS)[None, :]
+        t[:] = np.broadcast_to(values[:, :, None, None], (TIMES, 2, LATS, LONS))
+
+
+def test_read_variables_with_and_without_levels(tmp_path):
+    merra_file = str(tmp_path / "merra.nc")
+    write_merra_file(merra_file)
+
+    cube = MerraCube.read(merra_file, ["PS", "T"])
+
+    assert cube.data.shape == (TIMES, 2, LATS, LONS)
+    assert cube.times == TIMES
+    for time in range(TIMES):
+        assert (cube.data[time, 0] == time * 100).all()
+        # Only the lowest model level is read
+        assert (cube.data[time, 1] == time * 100 + 72).all()
+
+
+def test_read_missing_level(tmp_path, monkeypatch):
+    merra_file = str(tmp_path / "merra.nc")
+    write_merra_file(merra_file)
+    monkeypatch.setattr("empatia.etl.merra_cube.MERRA_LEVEL", 1.0)
+
+    with pytest.raises(ValueError):
+        MerraCube.read(merra_file, ["PS", "T"])
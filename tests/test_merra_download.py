@@ -0,0 +1,82 @@
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import pytest
+from requests.exceptions import HTTPError
+
+from empatia.etl import downloader, merra_data_source
+from empatia.etl.download_cache import DownloadCache
+
+DATE = "2021-01-01"
+
+
+class MerraHandler(BaseHTTPRequestHandler):
+    """
+    Serve the product of each path. The first request for /transient fails
+    with a 503, every request for /failed fails with a 500.
+    """
+
+    requests: Counter = Counter()
+
+    def do_GET(self):
+        path = urlparse(self.path).path.strip("/")
+        self.requests[path] += 1
+        if path == "failed" or (path == "transient" and self.requests[path] == 1):
+            self.send_error(503 if path == "transient" else 500)
+            return
+
+        body = f"{path} contents".encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    MerraHandler.requests = Counter()
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), MerraHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def get_dataset(base_url, name):
+    return {
+        "base_url": f"{base_url}/{name}",
+        "product": f"MERRA2_400.{name}",
+        "shortname": name.upper(),
+        "region": ["-55.05", "-73.57", "-21.78", "-53.64"],
+        "start_hour": "12:30:00",
+        "end_hour": "20:30:59",
+        "version": "5.12.4",
+        "variables": ["BCCMASS"],
+    }
+
+
+def test_concurrent_merra_download(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(merra_data_source, "MERRA_DATASET_PATH", tmp_path)
+    monkeypatch.setattr(downloader, "_cache", DownloadCache(str(tmp_path / "i.json")))
+    monkeypatch.setattr(downloader, "_sessions", {})
+    monkeypatch.setattr(downloader, "DOWNLOAD_RETRIES", 2)
+    monkeypatch.setattr(downloader, "DOWNLOAD_BACKOFF_FACTOR", 0)
+    names = ["ok", "transient", "failed"]
+    datasets = [get_dataset(server, name) for name in names]
+
+    with pytest.raises(HTTPError):
+        merra_data_source.get_all_merra_files(DATE, datasets)
+
+    for name in ["ok", "transient"]:
+        merra_file = tmp_path / name.upper() / DATE / f"MERRA2_400.{name}.nc"
+        assert merra_file.read_text() == f"{name} contents"
+    # The transient error is retried, the failed file is given up after
+    # DOWNLOAD_RETRIES retries and leaves no file behind
+    assert MerraHandler.requests == {"ok": 1, "transient": 2, "failed": 3}
+    assert not (tmp_path / "FAILED" / DATE / "MERRA2_400.failed.nc").exists()
@@ -0,0 +1,42 @@
+from unittest import mock
+
+import pytest
+
+URL = "https://ladsweb.modaps.eosdis.nasa.gov/archive/allData/61/MCD19A2/2021/001"
+FILES = {
+    "101": ("MCD19A2.A2021001.h12v11.061.hdf", 1000),
+    "102": ("MCD19A2.A2021001.h12v12.061.hdf", 2000),
+    "103": ("MCD19A2.A2021001.h13v12.061.hdf", 3000),
+}
+
+
+def get_client(missing=()):
+    """
+    LAADS client that returns the metadata and urls of the files in reverse
+    order, without the `missing` ones
+    """
+    found = [file_id for file_id in reversed(FILES) if file_id not in missing]
+    mclient = mock.Mock()
+    mclient.getFileProperties.return_value = [
+        {"fileId": int(i), "fileName": FILES[i][0], "fileSizeBytes": str(FILES[i][1])}
+        for i in found
+    ]
+    mclient.getFileUrls.return_value = [f"{URL}/{FILES[i][0]}" for i in found]
+    return mclient
+
+
+def test_resolve_files_pairs_results_by_file():
+    modis_data_source = pytest.importorskip("empatia.etl.modis_data_source")
+
+    fnames, urls, sizes = modis_data_source.resolve_files(get_client(), list(FILES))
+
+    assert fnames == [name for name, _ in FILES.values()]
+    assert urls == [f"{URL}/{name}" for name in fnames]
+    assert sizes == [size for _, size in FILES.values()]
+
+
+def test_resolve_files_with_missing_metadata():
+    modis_data_source = pytest.importorskip("empatia.etl.modis_data_source")
+
+    with pytest.raises(ValueError, match="102"):
+        modis_data_source.resolve_files(get_client(missing=["102"]), list(FILES))
@@ -0,0 +1,82 @@
+import os
+
+import numpy as np
+import pytest
+import rasterio
+from rasterio.crs import CRS
+from rasterio.transform import from_origin
+
+PROFILE = {
+    "crs": CRS.from_epsg(4326),
+    "transform": from_origin(-70, -26, 0.1, 0.1),
+    "width": 30,
+    "height": 20,
+}
+GROUP = ["PM10_media_Terra", "PM10_desvest_Terra", "PM10_n"]
+
+
+def write_monthly_product(tmp_path):
+    from empatia.utils.accumulators import RasterAccumulator
+
+    shape = (PROFILE["height"], PROFILE["width"])
+    mask = np.ones(shape, dtype=bool)
+    acc = RasterAccumulator.empty(str(tmp_path / "acc.npz"), shape)
+    rng = np.random.default_rng(0)
+    for _ in range(3):
+        acc.add(rng.uniform(0, 150, shape))
+    product = str(tmp_path / "PM10m_20210101_20210131_T_v001")
+    acc.export(product, GROUP, PROFILE, mask, -9999)
+    return product
+
+
+@pytest.mark.parametrize("raster_engine", ["memory", "grass"])
+def test_monthly_png(tmp_path, raster_engine):
+    pytest.importorskip("gdal")
+    if raster_engine == "grass" and "GISRC" not in os.environ:
+        pytest.skip("GRASS session is not running")
+    pipelines = pytest.importorskip("empatia.cli.pipelines")
+    from empatia.utils import engine
+
+    domain = tmp_path / "domain.tif"
+    with rasterio.open(
+        domain, "w", driver="GTiff", count=1, dtype="float32", **PROFILE
+    ) as dst:
+        dst.write(np.ones((1, PROFILE["height"], PROFILE["width"]), np.float32))
+    engine.use_engine(raster_engine)
+    engine.set_domain(domain)
+    product = write_monthly_product(tmp_path)
+
+    pipelines.export_monthly_png(product, GROUP[0])
+
+    assert os.path.exists(f"{product}.png")
+
+
+def test_monthly_png_colors_the_mean(tmp_path):
+    pytest.importorskip("gdal")
+    pipelines = pytest.importorskip("empatia.cli.pipelines")
+    from empatia.settings import PM10_COLOR_RULES_PATH
+    from empatia.utils import engine, memory
+
+    domain = tmp_path / "domain.tif"
+    with rasterio.open(
+        domain, "w", driver="GTiff", count=1, dtype="float32", **PROFILE
+    ) as dst:
+        dst.write(np.ones((1, PROFILE["height"], PROFILE["width"]), np.float32))
+    engine.use_engine("memory")
+    engine.set_domain(domain)
+    product = write_monthly_product(tmp_path)
+
+    pipelines.export_monthly_png(product, GROUP[0])
+
+    with rasterio.open(f"{product}.tif") as src:
+        mean = src.read(1)
+    values, colors = memory._read_color_rules(PM10_COLOR_RULES_PATH)
+    with rasterio.open(f"{product}.png") as src:
+        png = src.read()
+    inside = (mean >= values[0]) & (mean <= values[-1])
+    for band in range(3):
+        expected = np.where(
+            inside, np.interp(mean, values, colors[:, band]), memory.DEFAULT_COLOR
+        )
+        np.testing.assert_allclose(png[band], expected, atol=1)
+    assert (png[3] == 255).all()
@@ -0,0 +1,148 @@
+import os
+
+import numpy as np
+import pytest
+from rasterio.transform import from_origin
+from rasterio.warp import Resampling, reproject
+
+from empatia.utils.regrid import BilinearRegridder
+
+CRS = "EPSG:4326"
+SRC_TRANSFORM = from_origin(-70, -26, 0.5, 0.5)
+SRC_SHAPE = (8, 12)
+DST_TRANSFORM = from_origin(-70, -26, 0.1, 0.1)
+DST_SHAPE = (40, 60)
+
+
+def cell_centers(transform, shape):
+    rows, cols = np.indices(shape)
+    xs = transform.c + transform.a * (cols + 0.5)
+    ys = transform.f + transform.e * (rows + 0.5)
+    return xs, ys
+
+
+def linear_field(xs, ys):
+    return 3.0 * xs - 2.0 * ys + 7.0
+
+
+def build(skip_nulls=False):
+    return BilinearRegridder.build(
+        SRC_TRANSFORM, SRC_SHAPE, DST_TRANSFORM, DST_SHAPE, skip_nulls=skip_nulls
+    )
+
+
+def interior(shape, border):
+    cells = np.zeros(shape, dtype=bool)
+    cells[border:-border, border:-border] = True
+    return cells
+
+
+@pytest.mark.parametrize("skip_nulls", [False, True])
+def test_linear_field_is_exact(skip_nulls):
+    data = linear_field(*cell_centers(SRC_TRANSFORM, SRC_SHAPE))
+    expected = linear_field(*cell_centers(DST_TRANSFORM, DST_SHAPE))
+
+    regridded = build(skip_nulls).regrid(data)
+
+    # Cells within half a source cell of the edge have no bilinear neighbours
+    valid = interior(DST_SHAPE, 3)
+    np.testing.assert_allclose(regridded[valid], expected[valid])
+
+
+def test_matches_rasterio_bilinear():
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=SRC_SHAPE)
+    expected = np.full(DST_SHAPE, np.nan)
+    reproject(
+        data,
+        expected,
+        src_transform=SRC_TRANSFORM,
+        src_crs=CRS,
+        dst_transform=DST_TRANSFORM,
+        dst_crs=CRS,
+        resampling=Resampling.bilinear,
+    )
+
+    regridded = build().regrid(data)
+
+    valid = interior(DST_SHAPE, 3)
+    np.testing.assert_allclose(regridded[valid], expected[valid], atol=1e-6)
+
+
+def test_nulls_and_edges():
+    data = linear_field(*cell_centers(SRC_TRANSFORM, SRC_SHAPE))
+    data[4, 6] = np.nan
+    null_center = (22, 32)  # destination cell at the center of the null cell
+    null_neighbour = (22, 36)  # interpolated from the null cell and another
+    edge = (0, 0)  # within half a source cell of the edge
+
+    regridded = build().regrid(data)
+
+    # Default mode, as r.resamp.interp: any null or missing neighbour nulls
+    # the cell
+    assert np.isnan(regridded[null_center])
+    assert np.isnan(regridded[null_neighbour])
+    assert np.isnan(regridded[edge])
+
+    regridded = build(skip_nulls=True).regrid(data)
+
+    # skip_nulls mode, as GDAL: only cells whose nearest source cell is null
+    # are null, the others interpolate their valid neighbours
+    assert np.isnan(regridded[null_center])
+    assert regridded[null_neighbour] == pytest.approx(data[4, 7])
+    assert regridded[edge] == pytest.approx(data[0, 0])
+
+
+def test_matches_r_resamp_interp():
+    gscript = pytest.importorskip("grass.script")
+    garray = pytest.importorskip("grass.script.array")
+    if "GISRC" not in os.environ:
+        pytest.skip("GRASS session is not running")
+
+    def set_region(transform, shape):
+        rows, cols = shape
+        gscript.run_command(
+            "g.region",
+            w=transform.c,
+            n=transform.f,
+            e=transform.c + transform.a * cols,
+            s=transform.f + transform.e * rows,
+            rows=rows,
+            cols=cols,
+        )
+
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=SRC_SHAPE)
+    data[4, 6] = np.nan
+    set_region(SRC_TRANSFORM, SRC_SHAPE)
+    source = garray.array()
+    source[...] = data
+    source.write(mapname="test_regrid_source", overwrite=True)
+    set_region(DST_TRANSFORM, DST_SHAPE)
+    gscript.run_command(
+        "r.resamp.interp",
+        input="test_regrid_source",
+        output="test_regrid_output",
+        method="bilinear",
+        overwrite=True,
+    )
+    expected = garray.array()
+    expected.read("test_regrid_output")
+
+    regridded = build().regrid(data)
+
+    np.testing.assert_array_equal(np.isnan(regridded), np.isnan(expected))
+    valid = ~np.isnan(regridded)
+    np.testing.assert_allclose(regridded[valid], np.asarray(expected)[valid])
+
+
+def test_regridders_in_memory_are_bounded(tmp_path, monkeypatch):
+    from empatia.utils import regrid
+
+    monkeypatch.setattr(regrid, "_regridders", regrid.OrderedDict())
+    for cols in range(1, regrid.MAX_CACHED_REGRIDDERS + 3):
+        BilinearRegridder.load(
+            tmp_path, SRC_TRANSFORM, (2, cols), DST_TRANSFORM, (4, 2 * cols)
+        )
+
+    assert len(regrid._regridders) == regrid.MAX_CACHED_REGRIDDERS